@@ -0,0 +1,130 @@
+"""
+Бенчмарк серверных prepared statements (db_statements).
+
+Выполняет набор запросов одного сообщения «Следующий» + «Список избранных»
+(пользователь, кандидат, фото, избранное) двумя способами на одной и той же
+базе из .env:
+- текстом запроса (PostgreSQL разбирает и планирует его каждый раз);
+- через EXECUTE подготовленного запроса.
+
+Запуск из корня проекта:
+    python benchmarks/bench_prepared_statements.py [VK_ID] [ИТЕРАЦИЙ]
+
+Если VK_ID не указан, берётся любой пользователь из таблицы users.
+"""
+
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from psycopg2.extras import RealDictCursor
+
+from db_connection import create_db_connection
+from db_statements import STATEMENTS, CANDIDATE_START, execute_prepared
+
+# Запросы, выполняемые при обработке сообщения
+MESSAGE_STATEMENTS = ("user_by_vk_id", "user_bucket", "candidate_in_bucket",
+                      "photos_by_profile", "favorites_by_vk_id")
+
+
+def plain_sql(name: str) -> str:
+    """
+    Переводит текст запроса из реестра в запрос psycopg2 с именованными параметрами.
+    """
+    return re.sub(r"\$(\d+)", r"%(p\1)s", STATEMENTS[name][1])
+
+
+def message_params(user: dict) -> dict[str, tuple]:
+    """
+    Возвращает параметры запросов одного сообщения для пользователя user
+    (строка users с корзиной пользователя из candidate_pool).
+    """
+    target_sex = {1: 2, 2: 1}.get(user["sex"], 0)
+    return {
+        "user_by_vk_id": (user["vk_user_id"],),
+        "user_bucket": (user["vk_user_id"], 0),
+        "candidate_in_bucket": (user["id"], user["current_profile_id"], user["city_id"],
+                                target_sex, user["age_band"]) + CANDIDATE_START,
+        "photos_by_profile": (user["current_profile_id"],),
+        "favorites_by_vk_id": (user["vk_user_id"],),
+    }
+
+
+def run_plain(cur, params: dict[str, tuple]):
+    """
+    Выполняет запросы сообщения текстом.
+    """
+    for name in MESSAGE_STATEMENTS:
+        values = {f"p{i}": v for i, v in enumerate(params[name], start=1)}
+        cur.execute(plain_sql(name), values)
+        cur.fetchall()
+
+
+def run_prepared(cur, params: dict[str, tuple]):
+    """
+    Выполняет запросы сообщения через EXECUTE.
+    """
+    for name in MESSAGE_STATEMENTS:
+        execute_prepared(cur, name, params[name])
+        cur.fetchall()
+
+
+def measure(func, cur, params: dict[str, tuple], iterations: int) -> list[float]:
+    """
+    Возвращает время каждой из iterations итераций func, мс.
+    """
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func(cur, params)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    """
+    Запускает бенчмарк и печатает результат.
+    """
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    with create_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            query = """
+                SELECT u.id, u.vk_user_id, u.current_profile_id, cp.city_id, cp.sex, cp.age_band
+                FROM users u
+                JOIN candidate_pool cp ON cp.vk_profiles_id = u.current_profile_id
+            """
+            if len(sys.argv) > 1:
+                cur.execute(query + " WHERE u.vk_user_id = %s", (int(sys.argv[1]),))
+            else:
+                cur.execute(query + " LIMIT 1")
+            row = cur.fetchone()
+            if not row:
+                print("В таблице users нет пользователя с анкетой в пуле кандидатов для бенчмарка")
+                return
+            params = message_params(row)
+
+            # Прогрев кэшей PostgreSQL и первое PREPARE
+            run_plain(cur, params)
+            run_prepared(cur, params)
+
+            plain = measure(run_plain, cur, params, iterations)
+            prepared = measure(run_prepared, cur, params, iterations)
+        conn.rollback()
+    conn.close()
+
+    print(f"Запросов на сообщение: {len(MESSAGE_STATEMENTS)}, итераций: {iterations}")
+    for label, timings in (("текст запроса", plain), ("prepared", prepared)):
+        print(f"{label:>14}: среднее {statistics.mean(timings):.3f} мс, "
+              f"медиана {statistics.median(timings):.3f} мс")
+    saved = statistics.mean(plain) - statistics.mean(prepared)
+    print(f"Экономия на разборе и планировании: {saved:.3f} мс на сообщение "
+          f"({saved / statistics.mean(plain) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Бенчмарк регистрации пользователя (add_user_to_db) на базе из .env.
+
+Сравнивает запись анкеты, пользователя, трёх фото и строки пула кандидатов:
+- прежним способом — отдельными запросами (UPSERT анкеты, SELECT и
+  UPDATE/INSERT пользователя, SELECT и INSERT каждого фото, UPSERT пула);
+- одним запросом register_user из db_statements.
+
+Для каждого способа измеряются первая регистрация и повторная регистрация
+без изменений (основной случай: пользователь пишет боту снова).
+Используются синтетические отрицательные VK ID, все изменения
+откатываются в конце.
+
+Запуск из корня проекта:
+    python benchmarks/bench_registration.py [ПОЛЬЗОВАТЕЛЕЙ]
+"""
+
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from psycopg2.extras import RealDictCursor
+
+from db_connection import create_db_connection
+from db_modules import create_tables
+from db_statements import (AGE_BAND_SQL, POOL_SCORE_SQL, POOL_UPSERT_CONFLICT_SQL,
+                           execute_prepared, prepare_statement)
+
+
+class CountingCursor(RealDictCursor):
+    """
+    Курсор, считающий выполненные запросы.
+    """
+    statements = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.statements += 1
+        return super().execute(query, vars)
+
+
+def fake_profile(vk_id: int) -> tuple:
+    """
+    Возвращает поля синтетической анкеты и ключи трёх её фото.
+    """
+    photos = [f"{vk_id}_{n}" for n in range(1, 4)]
+    return (vk_id, "Имя", "Фамилия", 1, 1, "1.1.1990", f"https://vk.com/id{vk_id}"), photos
+
+
+def register_legacy(cur, profile: tuple, photos: list[str], now: datetime) -> int:
+    """
+    Регистрация отдельными запросами, как до перехода на register_user.
+    """
+    cur.execute("""
+        INSERT INTO vk_profiles (vk_id, first_name, last_name, sex,
+        city_id, birth_date, profile_url, created_at, updated_at)
+        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        ON CONFLICT (vk_id) DO UPDATE
+            SET first_name = EXCLUDED.first_name,
+                last_name = EXCLUDED.last_name,
+                sex = EXCLUDED.sex,
+                city_id = EXCLUDED.city_id,
+                birth_date = EXCLUDED.birth_date,
+                profile_url = EXCLUDED.profile_url,
+                updated_at = EXCLUDED.updated_at
+        RETURNING id;
+    """, profile + (now, now))
+    vk_profiles_id = cur.fetchone()['id']
+
+    cur.execute("SELECT id, current_profile_id FROM users WHERE vk_user_id = %s;", (profile[0],))
+    user_row = cur.fetchone()
+    if user_row:
+        user_db_id = user_row['id']
+        cur.execute("UPDATE users SET current_profile_id = %s, update_at = %s WHERE id = %s;",
+                    (vk_profiles_id, now, user_db_id))
+    else:
+        cur.execute("""
+            INSERT INTO users (vk_user_id, created_at, update_at, current_profile_id)
+            VALUES (%s,%s,%s,%s) RETURNING id;
+        """, (profile[0], now, now, vk_profiles_id))
+        user_db_id = cur.fetchone()['id']
+
+    for key in photos:
+        cur.execute("SELECT id FROM vk_photos WHERE vk_profiles_id = %s AND photo_id = %s;",
+                    (vk_profiles_id, key))
+        if cur.fetchone():
+            continue
+        cur.execute("INSERT INTO vk_photos (vk_profiles_id, photo_id, fetched_at) VALUES (%s,%s,%s);",
+                    (vk_profiles_id, key, now))
+
+    cur.execute(f"""
+        INSERT INTO candidate_pool (vk_profiles_id, city_id, sex, age_band, score, refreshed_at)
+        SELECT p.id, COALESCE(p.city_id, 0), COALESCE(p.sex, 0), {AGE_BAND_SQL},
+               {POOL_SCORE_SQL}, now()
+        FROM vk_profiles p
+        WHERE p.id = %s
+        {POOL_UPSERT_CONFLICT_SQL}
+    """, (vk_profiles_id,))
+    return user_db_id
+
+
+def register_single(cur, profile: tuple, photos: list[str], now: datetime) -> int:
+    """
+    Регистрация одним запросом register_user.
+    """
+    execute_prepared(cur, "register_user", profile + (now, photos))
+    return cur.fetchone()['user_id']
+
+
+def measure(func, cur, vk_ids: range, now: datetime) -> tuple[list[float], float]:
+    """
+    Регистрирует пользователей vk_ids через func.
+
+    Returns:
+        tuple[list[float], float]: Время каждой регистрации, мс, и среднее
+        число запросов на регистрацию.
+    """
+    timings = []
+    CountingCursor.statements = 0
+    for vk_id in vk_ids:
+        profile, photos = fake_profile(vk_id)
+        start = time.perf_counter()
+        func(cur, profile, photos, now)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, CountingCursor.statements / len(vk_ids)
+
+
+def report(label: str, timings: list[float], statements: float):
+    """
+    Печатает строку результата.
+    """
+    print(f"{label:>32}: запросов {statements:.1f}, среднее {statistics.mean(timings):.3f} мс, "
+          f"медиана {statistics.median(timings):.3f} мс")
+
+
+def main():
+    """
+    Запускает бенчмарк и печатает результат.
+    """
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    legacy_ids = range(-1_000_000, -1_000_000 + users)
+    single_ids = range(-2_000_000, -2_000_000 + users)
+    now = datetime.now(timezone.utc)
+
+    create_tables()
+    with create_db_connection() as conn:
+        with conn.cursor(cursor_factory=CountingCursor) as cur:
+            prepare_statement(cur, "register_user")
+
+            results = [
+                ("отдельные запросы, новый", *measure(register_legacy, cur, legacy_ids, now)),
+                ("отдельные запросы, повтор", *measure(register_legacy, cur, legacy_ids, now)),
+                ("register_user, новый", *measure(register_single, cur, single_ids, now)),
+                ("register_user, повтор", *measure(register_single, cur, single_ids, now)),
+            ]
+        conn.rollback()
+    conn.close()
+
+    print(f"Пользователей: {users}")
+    for label, timings, statements in results:
+        report(label, timings, statements)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,16 +6,31 @@
 - DB_USER — пользователь базы данных;
 - DB_PASSWORD — пароль пользователя;
 - DB_HOST — адрес сервера базы данных;
-- DB_PORT — порт базы данных.
+- DB_PORT — порт базы данных;
+- DB_PRIMARY_DSN — строка подключения к основному серверу (вместо DB_NAME..DB_PORT);
+- DB_REPLICA_DSN — строка подключения к реплике для запросов только на чтение;
+- DB_READ_YOUR_WRITES_SEC — сколько секунд после записи читать данные
+  пользователя с основного сервера, а не с реплики;
+- DB_REPLICA_RETRY_SEC — через сколько секунд снова пробовать реплику
+  после ошибки подключения к ней (до этого чтение идёт на основной сервер);
+- DB_REPLICA_CHECK_IDLE_SEC — подключение к реплике, простоявшее в пуле
+  дольше этого времени, перед выдачей проверяется запросом SELECT 1;
+- DB_POOL_MIN, DB_POOL_MAX — размер пула подключений (для каждого сервера).
 
 Используется для всех операций с базой данных в проекте VK Dating Bot.
 """
 
 import os
+import threading
+import time
+from contextlib import contextmanager
 
 import psycopg2
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 from dotenv import load_dotenv
 
+from profiling import ProfiledConnection, span
+
 # Загрузка переменных из .env
 load_dotenv()
 
@@ -25,12 +40,50 @@ db_user = os.getenv("DB_USER")
 db_password = os.getenv("DB_PASSWORD")
 db_host = os.getenv("DB_HOST")
 db_port = os.getenv("DB_PORT")
+db_pool_min = int(os.getenv("DB_POOL_MIN", "1"))
+db_pool_max = int(os.getenv("DB_POOL_MAX", "10"))
+db_primary_dsn = os.getenv("DB_PRIMARY_DSN")
+db_replica_dsn = os.getenv("DB_REPLICA_DSN")
+read_your_writes_sec = float(os.getenv("DB_READ_YOUR_WRITES_SEC", "5"))
+replica_retry_sec = float(os.getenv("DB_REPLICA_RETRY_SEC", "30"))
+replica_check_idle_sec = float(os.getenv("DB_REPLICA_CHECK_IDLE_SEC", "1"))
+
+# Пулы подключений: "primary" — основной сервер, "replica" — реплика
+_pools = {}
+_pool_lock = threading.Lock()
+
+# До какого времени (time.monotonic) не обращаться к недоступной реплике
+_replica_down_until = 0.0
+
+# VK ID пользователя -> время последней записи его данных (time.monotonic)
+_recent_writes = {}
+# При каком размере _recent_writes удалять устаревшие записи
+_RECENT_WRITES_PRUNE_AT = 10000
+
+
+class BotConnection(ProfiledConnection):
+    """
+    Подключение к БД бота.
+
+    Хранит имена серверных prepared statements, уже подготовленных
+    в сессии этого подключения (см. db_statements), и время возврата
+    в пул (None — подключение ещё не использовалось).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        self.released_at = None
+
 
 def create_db_connection() -> psycopg2.extensions.connection:
     """
     Создает подключение к базе данных PostgreSQL.
 
-    Использует параметры из переменных окружения: DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT.
+    Использует DB_PRIMARY_DSN или параметры из переменных окружения:
+    DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT.
+    Для обработки сообщений используйте get_db_connection — он берёт
+    подключение из пула.
 
     Returns:
         psycopg2.extensions.connection: Объект подключения к базе данных.
@@ -38,11 +91,179 @@ def create_db_connection() -> psycopg2.extensions.connection:
     Raises:
         psycopg2.OperationalError: Если подключение не удалось.
     """
-    conn = psycopg2.connect(
-        dbname=db_name,
-        user=db_user,
-        password=db_password,
-        host=db_host,
-        port=db_port
-    )
-    return conn
\ No newline at end of file
+    args, kwargs = _connect_params("primary")
+    with span("db_connect", "connect"):
+        conn = psycopg2.connect(*args, **kwargs)
+    return conn
+
+
+def _connect_params(role: str) -> tuple[tuple, dict]:
+    """
+    Возвращает аргументы psycopg2.connect для сервера role ("primary" или "replica").
+    """
+    if role == "replica":
+        return (db_replica_dsn,), {"connection_factory": BotConnection}
+    if db_primary_dsn:
+        return (db_primary_dsn,), {"connection_factory": BotConnection}
+    return (), {
+        "dbname": db_name,
+        "user": db_user,
+        "password": db_password,
+        "host": db_host,
+        "port": db_port,
+        "connection_factory": BotConnection
+    }
+
+
+def _get_pool(role: str) -> ThreadedConnectionPool:
+    """
+    Возвращает пул подключений к серверу role, создавая его при первом обращении.
+    """
+    pool = _pools.get(role)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(role)
+            if pool is None:
+                args, kwargs = _connect_params(role)
+                with span("db_connect", f"pool.create.{role}"):
+                    pool = ThreadedConnectionPool(db_pool_min, db_pool_max, *args, **kwargs)
+                _pools[role] = pool
+    return pool
+
+
+def _getconn(role: str) -> tuple[ThreadedConnectionPool, BotConnection]:
+    """
+    Берёт подключение из пула сервера role. Возвращает пул и подключение.
+    """
+    pool = _get_pool(role)
+    with span("db_connect", f"pool.getconn.{role}"):
+        conn = pool.getconn()
+    return pool, conn
+
+
+def _getconn_replica() -> tuple[ThreadedConnectionPool, BotConnection] | None:
+    """
+    Берёт подключение из пула реплики в режиме READ ONLY.
+
+    Ошибка подключения к реплике выключает её на DB_REPLICA_RETRY_SEC секунд,
+    а исчерпанный пул — только для этого вызова. Подключение, простоявшее
+    в пуле дольше DB_REPLICA_CHECK_IDLE_SEC, проверяется до выдачи: после
+    перезапуска реплики оно разорвано, и запрос пользователя упал бы.
+
+    Returns:
+        tuple[ThreadedConnectionPool, BotConnection] | None: Пул и подключение
+        или None, если читать нужно с основного сервера.
+    """
+    global _replica_down_until
+    try:
+        pool, conn = _getconn("replica")
+    except PoolError as e:
+        print(f"Пул подключений к реплике исчерпан, чтение с основного сервера: {e}")
+        return None
+    except psycopg2.OperationalError as e:
+        print(f"Реплика недоступна, чтение с основного сервера: {e}")
+        _replica_down_until = time.monotonic() + replica_retry_sec
+        return None
+
+    try:
+        if not conn.readonly:
+            conn.readonly = True
+        if (conn.released_at is not None
+                and time.monotonic() - conn.released_at >= replica_check_idle_sec):
+            with span("db_connect", "check.replica"), conn.cursor() as cur:
+                cur.execute("SELECT 1")
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        # Разорванное подключение закрывается, новые к реплике создаются как обычно
+        print(f"Подключение к реплике разорвано, чтение с основного сервера: {e}")
+        pool.putconn(conn, close=True)
+        return None
+    return pool, conn
+
+
+def ensure_pool_capacity(connections: int):
+    """
+    Увеличивает DB_POOL_MAX до connections, если он меньше.
+
+    ThreadedConnectionPool не ждёт освобождения подключения, а сразу
+    выбрасывает PoolError, поэтому размер пула должен покрывать все
+    одновременные запросы. Вызывается до первого обращения к пулу.
+
+    Args:
+        connections (int): Сколько подключений может понадобиться одновременно.
+    """
+    global db_pool_max
+    if connections > db_pool_max:
+        if _pools:
+            print(f"Пул подключений уже создан, DB_POOL_MAX={db_pool_max} "
+                  f"не увеличен до {connections}")
+            return
+        print(f"DB_POOL_MAX увеличен с {db_pool_max} до {connections}")
+        db_pool_max = connections
+
+
+def mark_write(user_id: int):
+    """
+    Отмечает запись данных пользователя: следующие DB_READ_YOUR_WRITES_SEC
+    секунд его запросы на чтение идут на основной сервер.
+
+    Args:
+        user_id (int): VK ID пользователя.
+    """
+    now = time.monotonic()
+    _recent_writes[user_id] = now
+    if len(_recent_writes) > _RECENT_WRITES_PRUNE_AT:
+        for uid, written_at in list(_recent_writes.items()):
+            if now - written_at > read_your_writes_sec:
+                _recent_writes.pop(uid, None)
+
+
+def recently_wrote(user_id: int | None) -> bool:
+    """
+    Args:
+        user_id (int | None): VK ID пользователя.
+
+    Returns:
+        bool: Данные пользователя записывались менее DB_READ_YOUR_WRITES_SEC секунд назад.
+    """
+    written_at = _recent_writes.get(user_id)
+    return written_at is not None and time.monotonic() - written_at <= read_your_writes_sec
+
+
+@contextmanager
+def get_db_connection(readonly: bool = False, user_id: int | None = None):
+    """
+    Берёт подключение из пула на время блока with.
+
+    Запросы только на чтение (readonly=True) идут на реплику, если задан
+    DB_REPLICA_DSN, — кроме случая, когда данные пользователя user_id
+    недавно записывались (см. mark_write): тогда чтение идёт на основной
+    сервер, чтобы пользователь видел свои изменения. Подключения к реплике
+    работают в режиме READ ONLY. Если к реплике не удаётся подключиться,
+    её пул исчерпан или подключение из пула разорвано, чтение идёт
+    на основной сервер (см. _getconn_replica).
+
+    При успешном выходе из блока транзакция фиксируется, при исключении —
+    откатывается. Подключение возвращается в пул, а разорванное — закрывается.
+
+    Args:
+        readonly (bool): В блоке выполняются только запросы на чтение.
+        user_id (int | None): VK ID пользователя, чьи данные читаются.
+
+    Yields:
+        BotConnection: Подключение к базе данных.
+
+    Raises:
+        psycopg2.OperationalError: Если подключение не удалось.
+        psycopg2.pool.PoolError: Если в пуле нет свободных подключений.
+    """
+    replica = None
+    if (readonly and db_replica_dsn and not recently_wrote(user_id)
+            and time.monotonic() >= _replica_down_until):
+        replica = _getconn_replica()
+    pool, conn = replica or _getconn("primary")
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.released_at = time.monotonic()
+        pool.putconn(conn, close=bool(conn.closed))
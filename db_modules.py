@@ -5,9 +5,12 @@
 - создания таблиц базы данных PostgreSQL;
 - добавления и обновления пользователей и анкет VK;
 - хранения и получения фотографий пользователей;
-- получения следующего кандидата для показа;
+- получения следующего кандидата для показа из пула кандидатов
+  (candidate_pool), разбитого на корзины по городу, полу и возрасту;
 - управления статусами анкет (избранное / чёрный список);
-- получения списка избранных анкет.
+- поиска взаимных симпатий (matches);
+- получения списка избранных анкет;
+- загрузки состояния пользователя для хранилища в памяти.
 
 Модуль инкапсулирует всю бизнес-логику взаимодействия с БД
 и используется основным приложением и VK-ботом.
@@ -17,7 +20,15 @@ from datetime import datetime, timezone
 
 from psycopg2.extras import RealDictCursor
 
-from db_connection import create_db_connection
+from db_connection import get_db_connection, mark_write
+from db_statements import (
+    execute_prepared,
+    AGE_BAND_SQL,
+    POOL_SCORE_SQL,
+    POOL_UPSERT_CONFLICT_SQL,
+    CANDIDATE_START
+)
+from user_state import UserState
 from vk_api_func import get_user_info, get_top3_photos_by_likes
 
 
@@ -27,9 +38,11 @@ def create_tables():
     - vk_profiles — анкеты пользователей VK;
     - users — локальные пользователи бота;
     - vk_photos — фотографии анкет;
-    - like_dislike — статусы кандидатов (like/dislike).
+    - like_dislike — статусы кандидатов (like/dislike);
+    - matches — взаимные симпатии пользователей;
+    - candidate_pool — пул кандидатов по корзинам (город, пол, возраст).
     """
-    with create_db_connection() as conn:
+    with get_db_connection() as conn:
         with conn.cursor() as cur:
             # Создаем таблицу с анкетами vk_profiles
             cur.execute("""
@@ -62,6 +75,11 @@ def create_tables():
                         ON UPDATE CASCADE
                 );
             """)
+            # Группа VK, в которую пользователь пишет боту: через неё ему
+            # отправляются уведомления, вызванные действиями других пользователей
+            cur.execute("""
+                ALTER TABLE users ADD COLUMN IF NOT EXISTS vk_group TEXT;
+            """)
 
             # Создаем таблицу с фотографиями vk_photos
             cur.execute("""
@@ -101,21 +119,85 @@ def create_tables():
                 );
             """)
 
+            # Индекс для поиска владельца анкеты (взаимные симпатии)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_users_current_profile
+                    ON users (current_profile_id);
+            """)
+
+            # Создаем таблицу взаимных симпатий matches
+            # (пара хранится один раз: user_low_id < user_high_id)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS matches (
+                    id BIGSERIAL PRIMARY KEY,
+                    user_low_id BIGINT NOT NULL,
+                    user_high_id BIGINT NOT NULL,
+                    matched_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    CONSTRAINT fk_matches_user_low
+                        FOREIGN KEY (user_low_id)
+                        REFERENCES users (id)
+                        ON DELETE CASCADE
+                        ON UPDATE CASCADE,
+                    CONSTRAINT fk_matches_user_high
+                        FOREIGN KEY (user_high_id)
+                        REFERENCES users (id)
+                        ON DELETE CASCADE
+                        ON UPDATE CASCADE,
+                    CONSTRAINT chk_matches_order
+                        CHECK (user_low_id < user_high_id),
+                    UNIQUE (user_low_id, user_high_id)
+                );
+            """)
+
+            # Создаем пул кандидатов candidate_pool: анкеты по корзинам
+            # (city_id, sex, age_band; 0 — неизвестно), упорядоченные по score
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS candidate_pool (
+                    vk_profiles_id BIGINT PRIMARY KEY,
+                    city_id INTEGER NOT NULL,
+                    sex SMALLINT NOT NULL,
+                    age_band SMALLINT NOT NULL,
+                    score INTEGER NOT NULL,
+                    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    CONSTRAINT fk_pool_vkprofile
+                        FOREIGN KEY (vk_profiles_id)
+                        REFERENCES vk_profiles (id)
+                        ON DELETE CASCADE
+                        ON UPDATE CASCADE
+                );
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_candidate_pool_bucket
+                    ON candidate_pool (city_id, sex, age_band, score DESC, vk_profiles_id DESC);
+            """)
+            # Корзина без возрастной группы — для пользователей без года рождения
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_candidate_pool_city_sex
+                    ON candidate_pool (city_id, sex, score DESC, vk_profiles_id DESC);
+            """)
+
             conn.commit()
 
-def add_user_to_db(user_id: int) -> int:
+def add_user_to_db(user_id: int) -> tuple[int, bool]:
     """
-    Добавляет пользователя VK в базу данных, если он ещё не существует.
+    Добавляет пользователя VK в базу данных, если он ещё не существует,
+    или обновляет его анкету.
+
+    Анкета (vk_profiles), пользователь (users), топ-3 фото (vk_photos) и строка
+    пула кандидатов записываются одним запросом (prepared statement
+    register_user) за один обмен с сервером. Неизменившиеся строки
+    не перезаписываются.
 
     Args:
         user_id (int): VK ID пользователя.
 
     Returns:
-        int: Внутренний ID записи в таблице users.
+        tuple[int, bool]: Внутренний ID записи в таблице users и признак того,
+        что в БД что-то изменилось.
 
     Raises:
         ValueError: Если пользователь VK не найден.
-        RuntimeError: Если не удалось вставить или обновить запись в vk_profiles.
+        RuntimeError: Если не удалось вставить или обновить пользователя.
     """
     user_info = get_user_info(user_id)
     if not user_info:
@@ -132,77 +214,57 @@ def add_user_to_db(user_id: int) -> int:
     profile_url = f"https://vk.com/id{vk_id}"
 
     top_photos = get_top3_photos_by_likes(user_id) or []
+    # В vk_photos храним ключ фото без префикса 'photo'
+    photo_keys = [a[5:] if a.startswith('photo') else a for a in top_photos]
 
     now = datetime.now(timezone.utc)
 
-    with create_db_connection() as conn:
+    with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # 1) Вставить или обновить vk_profiles (UPSERT по vk_id)
-            cur.execute("""
-                INSERT INTO vk_profiles (vk_id, first_name, last_name, sex, 
-                city_id, birth_date, profile_url, created_at, updated_at)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                ON CONFLICT (vk_id) DO UPDATE
-                    SET first_name = EXCLUDED.first_name,
-                        last_name = EXCLUDED.last_name,
-                        sex = EXCLUDED.sex,
-                        city_id = EXCLUDED.city_id,
-                        birth_date = EXCLUDED.birth_date,
-                        profile_url = EXCLUDED.profile_url,
-                        updated_at = EXCLUDED.updated_at
-                RETURNING id;
-            """, (vk_id, first_name, last_name, sex, city_id, birth_date, profile_url, now, now))
-
-            vk_profile_row = cur.fetchone()
-            if not vk_profile_row:
-                raise RuntimeError("Не удалось вставить/обновить vk_profiles")
-            vk_profiles_id = vk_profile_row['id']
-
-            # 2) Вставить пользователя в users если нет
-            # проверяем наличие пользователя по vk_user_id
-            cur.execute("SELECT id, current_profile_id FROM users WHERE vk_user_id = %s;", (vk_id,))
-            user_row = cur.fetchone()
-            if user_row:
-                user_db_id = user_row['id']
-                # обновим current_profile_id и update_at (если нужно)
-                cur.execute("""
-                        UPDATE users SET current_profile_id = %s, update_at = %s WHERE id = %s;
-                    """, (vk_profiles_id, now, user_db_id))
+            # UPSERT vk_profiles, users, vk_photos и candidate_pool одним запросом.
+            # При одновременной первой регистрации строки, вставленные другой
+            # транзакцией, не видны в снимке запроса, и user_id приходит NULL.
+            # Повторный запрос получает новый снимок (READ COMMITTED) и их видит.
+            changed = False
+            for _ in range(2):
+                execute_prepared(cur, "register_user", (
+                    vk_id, first_name, last_name, sex, city_id, birth_date,
+                    profile_url, now, photo_keys
+                ))
+                row = cur.fetchone()
+                changed = changed or bool(row and row['changed'])
+                if row and row['user_id'] is not None:
+                    break
             else:
-                cur.execute("""
-                        INSERT INTO users (vk_user_id, created_at, update_at, current_profile_id)
-                        VALUES (%s,%s,%s,%s) RETURNING id;
-                    """, (vk_id, now, now, vk_profiles_id))
-                user_db_id = cur.fetchone()['id']
-
-            # 3) Сохранить топ-3 фото
-            for attachment in top_photos:
-                key = attachment
-                if attachment.startswith('photo'):
-                    key = attachment[5:]
-                # проверим, есть ли уже такое фото для данного vk_profiles_id
-                cur.execute("""
-                        SELECT id FROM vk_photos WHERE vk_profiles_id = %s AND photo_id = %s;
-                    """, (vk_profiles_id, key))
-                if cur.fetchone():
-                    continue
-                cur.execute("""
-                        INSERT INTO vk_photos (vk_profiles_id, photo_id, fetched_at)
-                        VALUES (%s,%s,%s,%s);
-                    """, (vk_profiles_id, key, now))
+                raise RuntimeError(f"Не удалось вставить/обновить пользователя {vk_id}")
 
             conn.commit()
 
-    return user_db_id
+    if changed:
+        mark_write(user_id)
+    return row['user_id'], changed
 
-def get_next_candidate_from_db(user_id: int, last_id: int | None = None) ->  dict | None:
+def get_next_candidate_from_db(user_id: int, last_id: int | None = None,
+                               last_score: int | None = None) -> dict | None:
     """
     Получает следующего кандидата для пользователя, исключая уже просмотренные анкеты
     и те, что находятся в like_dislike.
 
+    Кандидат берётся из корзины пула кандидатов, подходящей пользователю:
+    тот же город, противоположный пол, та же возрастная группа (при неизвестном
+    поле или возрасте — любые). Анкеты идут по убыванию score, vk_profiles.id;
+    после последней анкеты корзины просмотр начинается сначала.
+
+    Запрос только на чтение: выполняется на реплике, если она настроена
+    (см. db_connection.get_db_connection).
+
     Args:
         user_id (int): VK ID пользователя.
         last_id (int | None): Внутренний ID последнего показанного кандидата.
+        last_score (int | None): Его score на момент показа. Позиция в корзине —
+            пара (last_score, last_id), поэтому изменение score кандидата после
+            показа не приводит к пропуску или повтору анкет. Если не указан,
+            берётся текущий score кандидата из пула.
 
     Returns:
         dict | None: Данные кандидата:
@@ -211,73 +273,54 @@ def get_next_candidate_from_db(user_id: int, last_id: int | None = None) ->  dic
                 "first_name": имя,
                 "last_name": фамилия,
                 "vk_link": ссылка на профиль VK,
-                "photos": список до 3 фото для attachment
+                "photos": список до 3 фото для attachment,
+                "score": score кандидата (для следующего вызова)
             }
         Возвращает None, если кандидатов нет.
     """
-    with create_db_connection() as conn:
+    with get_db_connection(readonly=True, user_id=user_id) as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # 1) Получаем внутренний users.id по vk_user_id
-            cur.execute("SELECT id FROM users WHERE vk_user_id = %s", (user_id,))
-            row = cur.fetchone()
-            if not row:
+            # 1) Корзина пользователя и позиция последнего показанного кандидата
+            execute_prepared(cur, "user_bucket", (user_id, last_id or 0))
+            bucket = cur.fetchone()
+            if not bucket:
                 return None
-
-            local_user_id = row['id']
-
-            # 2) Формируем список исключаемых анкет (like/dislike)
-            cur.execute("""
-                SELECT vk_profiles_id
-                FROM like_dislike
-                WHERE user_id = %s
-            """, (local_user_id,))
-            excluded = {r['vk_profiles_id'] for r in cur.fetchall()}
-
-            # 3) Исключаем текущий профиль пользователя
-            cur.execute("SELECT current_profile_id FROM users WHERE id = %s", (local_user_id,))
-            row = cur.fetchone()
-            if row and row.get('current_profile_id'):
-                excluded.add(row['current_profile_id'])
-
-            # 4) Строим WHERE-условия
-            params = []
-            where_clauses = []
-
-            if excluded:
-                where_clauses.append("id NOT IN %s")
-                params.append(tuple(excluded))
-
-            if last_id is not None:
-                where_clauses.append("id > %s")
-                params.append(last_id)
-
-            where_sql = ""
-            if where_clauses:
-                where_sql = "WHERE " + " AND ".join(where_clauses)
-
-            qry = f"""
-                SELECT id, vk_id, first_name, last_name, profile_url
-                FROM vk_profiles
-                {where_sql}
-                ORDER BY id ASC
-                LIMIT 1
-            """
-
-            cur.execute(qry, tuple(params))
+            if not last_id:
+                cursor = CANDIDATE_START
+            elif last_score is not None:
+                cursor = (last_score, last_id)
+            elif bucket['last_score'] is not None:
+                cursor = (bucket['last_score'], last_id)
+            else:
+                cursor = CANDIDATE_START
+
+            # 2) Следующая анкета корзины, исключая собственную анкету
+            # пользователя и анкеты из like_dislike. Фильтры только на
+            # равенство, чтобы индекс отдавал анкеты сразу в нужном порядке;
+            # при неизвестном поле корзины по каждому полу объединяются
+            target_sex = {1: 2, 2: 1}.get(bucket['sex'])
+            by_age = bucket['age_band'] != 0
+            if target_sex is None:
+                name = "candidate_in_bucket_any_sex" if by_age else "candidate_in_city_any_sex"
+            else:
+                name = "candidate_in_bucket" if by_age else "candidate_in_city_sex"
+            params = (bucket['user_db_id'], bucket['own_profile_id'], bucket['city_id'],
+                      target_sex or 0, bucket['age_band'])
+            execute_prepared(cur, name, params + cursor)
             candidate = cur.fetchone()
+            if not candidate and cursor != CANDIDATE_START:
+                # Корзина после курсора закончилась: начинаем сначала. Так
+                # показываются анкеты, попавшие выше курсора после его прохода
+                # (новые или с выросшим score); оценённые исключены NOT EXISTS
+                execute_prepared(cur, name, params + CANDIDATE_START)
+                candidate = cur.fetchone()
             if not candidate:
                 return None
 
             vk_profiles_id = candidate['id']
 
-            # 5) Получаем до 3 фотографий
-            cur.execute("""
-                SELECT photo_id
-                FROM vk_photos
-                WHERE vk_profiles_id = %s
-                ORDER BY fetched_at DESC
-                LIMIT 3
-            """, (vk_profiles_id,))
+            # 3) Получаем до 3 фотографий
+            execute_prepared(cur, "photos_by_profile", (vk_profiles_id,))
             photos_rows = cur.fetchall()
             photos = []
             for r in photos_rows:
@@ -292,7 +335,8 @@ def get_next_candidate_from_db(user_id: int, last_id: int | None = None) ->  dic
                 "first_name": candidate.get('first_name'),
                 "last_name": candidate.get('last_name'),
                 "vk_link": candidate.get('profile_url') or f"https://vk.com/id{candidate.get('vk_id')}",
-                "photos": photos
+                "photos": photos,
+                "score": candidate['score']
             }
 
             return result
@@ -301,6 +345,12 @@ def add_to_status(user_id: int, last_id: int, status: str) -> dict:
     """
     Добавляет или обновляет статус (like/dislike) кандидата для пользователя.
 
+    При статусе "like" одним индексным запросом проверяет, поставил ли владелец
+    анкеты кандидата (users.current_profile_id) лайк анкете пользователя.
+    Если да — записывает взаимную симпатию в matches. Проверка выполняется
+    под блокировкой пары пользователей (match_lock), поэтому одновременные
+    встречные лайки тоже дают взаимную симпатию.
+
     Args:
         user_id (int): VK ID пользователя.
         last_id (int): VK ID кандидата в таблице vk_profiles.
@@ -313,7 +363,9 @@ def add_to_status(user_id: int, last_id: int, status: str) -> dict:
                 "user_id": внутренний ID пользователя,
                 "vk_profiles_id": внутренний ID кандидата,
                 "like_dislike_id": ID записи в like_dislike,
-                "status": "like" или "dislike"
+                "status": "like" или "dislike",
+                "matches": пользователи с новой взаимной симпатией:
+                    [{"vk_user_id": VK ID, "group": имя группы VK или None}, ...]
             }
 
     Raises:
@@ -330,11 +382,13 @@ def add_to_status(user_id: int, last_id: int, status: str) -> dict:
 
     now = datetime.now(timezone.utc)
 
-    with create_db_connection() as conn:
+    with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # 1) Получаем локальный users.id по vk_user_id. Если пользователя нет — создаём
-            cur.execute("SELECT id FROM users WHERE vk_user_id = %s", (user_id,))
+            # 1) Получаем локальный users.id и анкету пользователя по vk_user_id.
+            # Если пользователя нет — создаём
+            execute_prepared(cur, "user_by_vk_id", (user_id,))
             row = cur.fetchone()
+            own_profile_id = row['current_profile_id'] if row else None
             if not row:
                 try:
                     add_user_to_db(user_id)
@@ -349,17 +403,18 @@ def add_to_status(user_id: int, last_id: int, status: str) -> dict:
                         raise RuntimeError("Не удалось создать пользователя")
                     local_user_id = new['id']
                 else:
-                    cur.execute("SELECT id FROM users WHERE vk_user_id = %s", (user_id,))
+                    execute_prepared(cur, "user_by_vk_id", (user_id,))
                     new = cur.fetchone()
                     if not new:
                         conn.rollback()
                         raise RuntimeError("Пользователь создан, но не найден")
                     local_user_id = new['id']
+                    own_profile_id = new['current_profile_id']
             else:
                 local_user_id = row['id']
 
             # 2) Находим внутренний vk_profiles.id по vk_id = last_id
-            cur.execute("SELECT id FROM vk_profiles WHERE vk_id = %s", (last_id,))
+            execute_prepared(cur, "profile_id_by_vk_id", (last_id,))
             row = cur.fetchone()
             if not row:
                 conn.rollback()
@@ -367,36 +422,136 @@ def add_to_status(user_id: int, last_id: int, status: str) -> dict:
             vk_profiles_id = row['id']
 
             # 3) UPSERT в like_dislike
-            cur.execute("""
-                INSERT INTO like_dislike (user_id, vk_profiles_id, status, added_at)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (user_id, vk_profiles_id) DO UPDATE
-                    SET status = EXCLUDED.status,
-                        added_at = EXCLUDED.added_at
-                RETURNING id, status;
-            """, (local_user_id, vk_profiles_id, status, now))
+            execute_prepared(cur, "rating_upsert", (local_user_id, vk_profiles_id, status, now))
             ld_row = cur.fetchone()
             if not ld_row:
                 conn.rollback()
                 raise RuntimeError("Не удалось вставить/обновить запись в like_dislike")
 
-            # 4) Обновляем users.current_profile_id и update_at
-            cur.execute("""
-                UPDATE users
-                SET current_profile_id = %s, update_at = %s
-                WHERE id = %s
-            """, (vk_profiles_id, now, local_user_id))
+            # 4) Обновляем update_at (current_profile_id — собственная анкета
+            # пользователя, её не трогаем)
+            execute_prepared(cur, "user_touch", (local_user_id, now))
+
+            # 5) Проверяем взаимную симпатию: владелец анкеты кандидата
+            # уже лайкнул анкету пользователя
+            matches = []
+            if ld_row['status'] == 'like' and own_profile_id:
+                # Без блокировки встречные лайки, поставленные одновременно,
+                # не видят друг друга (READ COMMITTED), и пара не записывается
+                execute_prepared(cur, "match_lock", (local_user_id, vk_profiles_id))
+                execute_prepared(cur, "match_probe", (own_profile_id, vk_profiles_id, local_user_id))
+                for other in cur.fetchall():
+                    execute_prepared(cur, "match_insert", (local_user_id, other['id'], now))
+                    if cur.fetchone():
+                        matches.append({"vk_user_id": other['vk_user_id'],
+                                        "group": other['vk_group']})
 
             conn.commit()
+            # Следующие чтения пользователя — с основного сервера (read-your-writes)
+            mark_write(user_id)
 
             return {
                 "ok": True,
                 "user_id": local_user_id,
                 "vk_profiles_id": vk_profiles_id,
                 "like_dislike_id": ld_row['id'],
-                "status": ld_row['status']
+                "status": ld_row['status'],
+                "matches": matches
             }
 
+def refresh_candidate_pool() -> int:
+    """
+    Полностью пересчитывает пул кандидатов по таблице vk_profiles одним запросом.
+
+    Нужен для анкет, добавленных до появления пула, и для пересчёта
+    возрастных групп со временем. Изменяются только строки, у которых
+    поменялась корзина или score (число фото анкеты, не больше 3).
+
+    Returns:
+        int: Количество добавленных или обновлённых строк пула.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO candidate_pool (vk_profiles_id, city_id, sex, age_band, score, refreshed_at)
+                SELECT p.id, COALESCE(p.city_id, 0), COALESCE(p.sex, 0), {AGE_BAND_SQL},
+                       {POOL_SCORE_SQL}, now()
+                FROM vk_profiles p
+                {POOL_UPSERT_CONFLICT_SQL};
+            """)
+            refreshed = cur.rowcount
+            conn.commit()
+    return refreshed
+
+def backfill_matches() -> int:
+    """
+    Находит взаимные симпатии среди уже существующих записей like_dislike
+    и записывает их в matches одним запросом.
+
+    Взаимная симпатия — пара пользователей, каждый из которых поставил
+    "like" собственной анкете (users.current_profile_id) другого.
+    Уже записанные пары пропускаются, уведомления не отправляются.
+
+    Returns:
+        int: Количество добавленных пар.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO matches (user_low_id, user_high_id, matched_at)
+                SELECT a.user_id, b.user_id, GREATEST(a.added_at, b.added_at)
+                FROM like_dislike a
+                JOIN users ua ON ua.id = a.user_id
+                JOIN users ub ON ub.current_profile_id = a.vk_profiles_id
+                JOIN like_dislike b
+                  ON b.user_id = ub.id
+                 AND b.vk_profiles_id = ua.current_profile_id
+                 AND b.status = 'like'
+                WHERE a.status = 'like'
+                  AND a.user_id < b.user_id
+                ON CONFLICT (user_low_id, user_high_id) DO NOTHING;
+            """)
+            added = cur.rowcount
+            conn.commit()
+    return added
+
+def load_user_state(user_id: int) -> UserState | None:
+    """
+    Загружает состояние пользователя из БД, когда его нет в памяти
+    (например, после вытеснения из хранилища).
+
+    Курсором просмотра становится последняя оценённая анкета, временем
+    регистрации — время последнего обновления записи users. Показанного
+    кандидата (UserState.shown_candidate) загруженное состояние не содержит:
+    чтобы оценить анкету, пользователь сначала запрашивает следующую.
+
+    Args:
+        user_id (int): VK ID пользователя.
+
+    Returns:
+        UserState | None: Состояние или None, если пользователь не найден.
+    """
+    with get_db_connection(readonly=True, user_id=user_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            execute_prepared(cur, "user_state_by_vk_id", (user_id,))
+            row = cur.fetchone()
+    if not row:
+        return None
+    return UserState(last_candidate=row['last_candidate'], user_db_id=row['id'],
+                     registered_at=row['updated_at'], group=row['vk_group'])
+
+def set_user_group(user_id: int, group_name: str):
+    """
+    Запоминает в БД группу VK, в которую пишет пользователь.
+
+    Args:
+        user_id (int): VK ID пользователя.
+        group_name (str): Имя группы (BotGroup.name).
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            execute_prepared(cur, "user_group_set", (user_id, group_name))
+
 def get_favorites(user_id: int) -> list[tuple[str, str, str]]:
     """
     Возвращает список избранных профилей пользователя.
@@ -407,33 +562,22 @@ def get_favorites(user_id: int) -> list[tuple[str, str, str]]:
     Returns:
         list[tuple[str, str, str]]: Список кортежей (first_name, last_name, profile_url).
         Пустой список, если пользователь не найден или избранных нет.
+
+    Запрос только на чтение: выполняется на реплике, если она настроена
+    (см. db_connection.get_db_connection).
     """
     if not user_id:
         return []
 
-    with create_db_connection() as conn:
+    with get_db_connection(readonly=True, user_id=user_id) as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # 1) Получаем локальный users.id по vk_user_id
-            cur.execute("SELECT id FROM users WHERE vk_user_id = %s", (user_id,))
-            row = cur.fetchone()
-            if not row:
-                return []
-
-            local_user_id = row['id']
-
-            # 2) Выбираем профили, которые пользователь пометил как 'like'
-            cur.execute("""
-                SELECT p.first_name, p.last_name, COALESCE(p.profile_url, ('https://vk.com/id' || p.vk_id)) AS profile_url
-                FROM like_dislike ld
-                JOIN vk_profiles p ON p.id = ld.vk_profiles_id
-                WHERE ld.user_id = %s
-                  AND ld.status = %s
-                ORDER BY ld.added_at DESC
-            """, (local_user_id, 'like'))
+            # 1) Выбираем профили, которые пользователь пометил как 'like'
+            # (пустой результат, если пользователя нет)
+            execute_prepared(cur, "favorites_by_vk_id", (user_id,))
 
             rows = cur.fetchall()
 
-            # 3) Конвертируем в список кортежей (first_name, last_name, profile_url)
+            # 2) Конвертируем в список кортежей (first_name, last_name, profile_url)
             favorites = []
             for r in rows:
                 first_name = r.get('first_name') or ''
@@ -0,0 +1,353 @@
+"""
+Реестр серверных prepared statements для частых запросов VK Dating Bot.
+
+Каждый запрос из STATEMENTS подготавливается (PREPARE) один раз на
+подключение из пула и затем выполняется по имени (EXECUTE) с фиксированным
+набором параметров. PostgreSQL не разбирает и не планирует текст такого
+запроса при каждом сообщении.
+
+Подключение должно быть создано с connection_factory=BotConnection
+(см. db_connection) — в нём хранится набор уже подготовленных имён.
+"""
+
+# Возрастная группа анкеты vk_profiles p: возраст // 5 (1..20),
+# 0 — дата рождения неизвестна или указана без года
+AGE_BAND_SQL = """
+    CASE WHEN p.birth_date ~ '^[0-9]{1,2}[.][0-9]{1,2}[.][0-9]{4}$'
+         THEN LEAST(20, GREATEST(1,
+                  date_part('year', age(to_date(p.birth_date, 'DD.MM.YYYY')))::int / 5))
+         ELSE 0
+    END
+"""
+
+# Score анкеты vk_profiles p в пуле кандидатов: число её фото в vk_photos,
+# не больше SCORE_MAX. Одно определение для регистрации и пересчёта пула,
+# иначе они перезаписывали бы score друг друга
+SCORE_MAX = 3
+PHOTO_COUNT_SQL = "(SELECT count(*) FROM vk_photos ph WHERE ph.vk_profiles_id = p.id)"
+POOL_SCORE_SQL = f"LEAST({SCORE_MAX}, {PHOTO_COUNT_SQL})"
+
+# Обновление строки пула кандидатов только при изменении корзины или score
+POOL_UPSERT_CONFLICT_SQL = """
+    ON CONFLICT (vk_profiles_id) DO UPDATE
+        SET city_id = EXCLUDED.city_id,
+            sex = EXCLUDED.sex,
+            age_band = EXCLUDED.age_band,
+            score = EXCLUDED.score,
+            refreshed_at = EXCLUDED.refreshed_at
+        WHERE (candidate_pool.city_id, candidate_pool.sex,
+               candidate_pool.age_band, candidate_pool.score)
+              IS DISTINCT FROM
+              (EXCLUDED.city_id, EXCLUDED.sex, EXCLUDED.age_band, EXCLUDED.score)
+"""
+
+# Типы параметров запросов candidate_*: $1 — users.id, $2 — собственная
+# анкета, $3 — город, $4 — искомый пол, $5 — возрастная группа,
+# $6, $7 — score и vk_profiles.id последнего показанного кандидата
+CANDIDATE_PARAM_TYPES = "bigint, bigint, integer, smallint, smallint, integer, bigint"
+
+# Начало просмотра корзины: (score, vk_profiles.id) больше любых в пуле
+CANDIDATE_START = (2 ** 31 - 1, 2 ** 63 - 1)
+
+
+def _candidate_sql(sexes: tuple[str, ...], by_age: bool) -> str:
+    """
+    Собирает запрос следующего кандидата из корзины пула.
+
+    Каждая ветка фильтрует candidate_pool только по равенству (город, пол,
+    при by_age — возрастная группа) и читает индекс по убыванию
+    (score, vk_profiles.id) после последнего показанного кандидата до
+    первой подходящей анкеты. Если пол пользователя неизвестен, ветки
+    по каждому полу объединяются UNION ALL, и из них берётся лучшая.
+
+    Args:
+        sexes (tuple[str, ...]): Выражения искомого пола, по ветке на каждое.
+        by_age (bool): Фильтровать по возрастной группе $5.
+
+    Returns:
+        str: Текст запроса с параметрами CANDIDATE_PARAM_TYPES.
+    """
+    branches = []
+    for sex in sexes:
+        filters = f"cp.city_id = $3 AND cp.sex = {sex}"
+        if by_age:
+            filters += " AND cp.age_band = $5"
+        branches.append(f"""
+            (SELECT cp.vk_profiles_id, cp.score
+             FROM candidate_pool cp
+             WHERE {filters}
+               AND (cp.score, cp.vk_profiles_id) < ($6, $7)
+               AND cp.vk_profiles_id <> $2
+               AND NOT EXISTS (
+                   SELECT 1
+                   FROM like_dislike ld
+                   WHERE ld.user_id = $1
+                     AND ld.vk_profiles_id = cp.vk_profiles_id
+               )
+             ORDER BY cp.score DESC, cp.vk_profiles_id DESC
+             LIMIT 1)""")
+    union = "\n            UNION ALL".join(branches)
+    return f"""
+        SELECT p.id, p.vk_id, p.first_name, p.last_name, p.profile_url, c.score
+        FROM ({union}
+        ) c
+        JOIN vk_profiles p ON p.id = c.vk_profiles_id
+        ORDER BY c.score DESC, c.vk_profiles_id DESC
+        LIMIT 1
+    """
+
+
+# Имя -> (типы параметров, текст запроса с параметрами $1, $2, ...)
+STATEMENTS = {
+    # Пользователь по VK ID
+    "user_by_vk_id": ("bigint", """
+        SELECT id, current_profile_id
+        FROM users
+        WHERE vk_user_id = $1
+    """),
+
+    # Корзина пользователя для подбора кандидатов: $1 — VK ID пользователя,
+    # $2 — последний показанный vk_profiles.id. Возвращает users.id,
+    # собственную анкету, город, пол и возрастную группу пользователя
+    # и score последнего показанного кандидата (NULL — его нет в пуле).
+    "user_bucket": ("bigint, bigint", """
+        SELECT u.id AS user_db_id, me.vk_profiles_id AS own_profile_id,
+               me.city_id, me.sex, me.age_band, last.score AS last_score
+        FROM users u
+        JOIN candidate_pool me ON me.vk_profiles_id = u.current_profile_id
+        LEFT JOIN candidate_pool last ON last.vk_profiles_id = $2
+        WHERE u.vk_user_id = $1
+    """),
+
+    # Следующий кандидат из корзины (см. _candidate_sql): по одному
+    # запросу на случай известных и неизвестных пола и возраста пользователя
+    "candidate_in_bucket": (
+        CANDIDATE_PARAM_TYPES, _candidate_sql(("$4",), by_age=True)),
+    "candidate_in_city_sex": (
+        CANDIDATE_PARAM_TYPES, _candidate_sql(("$4",), by_age=False)),
+    "candidate_in_bucket_any_sex": (
+        CANDIDATE_PARAM_TYPES, _candidate_sql(("0", "1", "2"), by_age=True)),
+    "candidate_in_city_any_sex": (
+        CANDIDATE_PARAM_TYPES, _candidate_sql(("0", "1", "2"), by_age=False)),
+
+    # Регистрация пользователя одним запросом: UPSERT анкеты vk_profiles
+    # (только при изменении полей), users, фото vk_photos и строки
+    # candidate_pool. $1 — VK ID, $2..$7 — поля анкеты, $8 — время,
+    # $9 — ключи фото. Возвращает users.id и признак изменений.
+    "register_user": ("bigint, text, text, smallint, integer, text, text, "
+                      "timestamptz, text[]", f"""
+        WITH profile AS (
+            INSERT INTO vk_profiles AS p (vk_id, first_name, last_name, sex,
+                city_id, birth_date, profile_url, created_at, updated_at)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $8)
+            ON CONFLICT (vk_id) DO UPDATE
+                SET first_name = EXCLUDED.first_name,
+                    last_name = EXCLUDED.last_name,
+                    sex = EXCLUDED.sex,
+                    city_id = EXCLUDED.city_id,
+                    birth_date = EXCLUDED.birth_date,
+                    profile_url = EXCLUDED.profile_url,
+                    updated_at = EXCLUDED.updated_at
+                WHERE (p.first_name, p.last_name, p.sex, p.city_id, p.birth_date, p.profile_url)
+                      IS DISTINCT FROM
+                      (EXCLUDED.first_name, EXCLUDED.last_name, EXCLUDED.sex,
+                       EXCLUDED.city_id, EXCLUDED.birth_date, EXCLUDED.profile_url)
+            RETURNING p.id, p.city_id, p.sex, p.birth_date
+        ),
+        profile_row AS (
+            SELECT id, city_id, sex, birth_date
+            FROM profile
+            UNION ALL
+            SELECT id, city_id, sex, birth_date
+            FROM vk_profiles
+            WHERE vk_id = $1
+              AND NOT EXISTS (SELECT 1 FROM profile)
+        ),
+        user_row AS (
+            INSERT INTO users AS u (vk_user_id, created_at, update_at, current_profile_id)
+            SELECT $1, $8, $8, id
+            FROM profile_row
+            ON CONFLICT (vk_user_id) DO UPDATE
+                SET current_profile_id = EXCLUDED.current_profile_id,
+                    update_at = EXCLUDED.update_at
+                WHERE u.current_profile_id IS DISTINCT FROM EXCLUDED.current_profile_id
+            RETURNING u.id
+        ),
+        photos AS (
+            INSERT INTO vk_photos (vk_profiles_id, photo_id, fetched_at)
+            SELECT pr.id, ph.photo_id, $8
+            FROM profile_row pr
+            CROSS JOIN unnest($9) AS ph (photo_id)
+            ON CONFLICT (vk_profiles_id, photo_id) DO NOTHING
+            RETURNING id
+        ),
+        pool AS (
+            -- score как в POOL_SCORE_SQL: фото, вставленные в CTE photos,
+            -- в vk_photos этого запроса ещё не видны и добавляются отдельно
+            INSERT INTO candidate_pool (vk_profiles_id, city_id, sex, age_band, score, refreshed_at)
+            SELECT p.id, COALESCE(p.city_id, 0), COALESCE(p.sex, 0), {AGE_BAND_SQL},
+                   LEAST({SCORE_MAX}, {PHOTO_COUNT_SQL} + (SELECT count(*) FROM photos)), $8
+            FROM profile_row p
+            {POOL_UPSERT_CONFLICT_SQL}
+            RETURNING vk_profiles_id
+        )
+        SELECT COALESCE((SELECT id FROM user_row),
+                        (SELECT id FROM users WHERE vk_user_id = $1)) AS user_id,
+               (EXISTS (SELECT 1 FROM profile)
+                OR EXISTS (SELECT 1 FROM user_row)
+                OR EXISTS (SELECT 1 FROM photos)
+                OR EXISTS (SELECT 1 FROM pool)) AS changed
+    """),
+
+    # Состояние пользователя для загрузки в память: users.id, время
+    # обновления (секунды Unix) и последняя оценённая анкета
+    "user_state_by_vk_id": ("bigint", """
+        SELECT u.id, u.vk_group,
+               extract(epoch FROM u.update_at)::float8 AS updated_at,
+               (SELECT ld.vk_profiles_id
+                FROM like_dislike ld
+                WHERE ld.user_id = u.id
+                ORDER BY ld.added_at DESC
+                LIMIT 1) AS last_candidate
+        FROM users u
+        WHERE u.vk_user_id = $1
+    """),
+
+    # До 3 фотографий анкеты
+    "photos_by_profile": ("bigint", """
+        SELECT photo_id
+        FROM vk_photos
+        WHERE vk_profiles_id = $1
+        ORDER BY fetched_at DESC
+        LIMIT 3
+    """),
+
+    # Внутренний vk_profiles.id по VK ID
+    "profile_id_by_vk_id": ("bigint", """
+        SELECT id
+        FROM vk_profiles
+        WHERE vk_id = $1
+    """),
+
+    # VK ID по внутреннему vk_profiles.id
+    "profile_vk_id_by_id": ("bigint", """
+        SELECT vk_id
+        FROM vk_profiles
+        WHERE id = $1
+    """),
+
+    # UPSERT статуса like/dislike
+    "rating_upsert": ("bigint, bigint, varchar, timestamptz", """
+        INSERT INTO like_dislike (user_id, vk_profiles_id, status, added_at)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (user_id, vk_profiles_id) DO UPDATE
+            SET status = EXCLUDED.status,
+                added_at = EXCLUDED.added_at
+        RETURNING id, status
+    """),
+
+    # Группа VK, в которую пишет пользователь (только при смене)
+    "user_group_set": ("bigint, text", """
+        UPDATE users
+        SET vk_group = $2
+        WHERE vk_user_id = $1
+          AND vk_group IS DISTINCT FROM $2
+    """),
+
+    # Обновление users.update_at
+    "user_touch": ("bigint, timestamptz", """
+        UPDATE users
+        SET update_at = $2
+        WHERE id = $1
+    """),
+
+    # Блокировка пар (пользователь $1, владелец лайкнутой анкеты $2) до конца
+    # транзакции: одновременные встречные лайки проверяются по очереди, и
+    # второй match_probe видит зафиксированный лайк первого. Ключ — пара
+    # users.id (по модулю 2^31 - 1: совпадение ключей лишь лишний раз
+    # упорядочивает транзакции). Пары блокируются по возрастанию id.
+    "match_lock": ("bigint, bigint", """
+        SELECT pg_advisory_xact_lock((LEAST(o.id, $1) % 2147483647)::int,
+                                     (GREATEST(o.id, $1) % 2147483647)::int)
+        FROM (
+            SELECT u.id
+            FROM users u
+            WHERE u.current_profile_id = $2
+              AND u.id <> $1
+            ORDER BY u.id
+        ) o
+    """),
+
+    # Взаимная симпатия: $1 — анкета пользователя, $2 — лайкнутая анкета,
+    # $3 — users.id пользователя
+    "match_probe": ("bigint, bigint, bigint", """
+        SELECT u.id, u.vk_user_id, u.vk_group
+        FROM users u
+        JOIN like_dislike ld
+          ON ld.user_id = u.id
+         AND ld.vk_profiles_id = $1
+         AND ld.status = 'like'
+        WHERE u.current_profile_id = $2
+          AND u.id <> $3
+    """),
+
+    "match_insert": ("bigint, bigint, timestamptz", """
+        INSERT INTO matches (user_low_id, user_high_id, matched_at)
+        VALUES (LEAST($1, $2), GREATEST($1, $2), $3)
+        ON CONFLICT (user_low_id, user_high_id) DO NOTHING
+        RETURNING id
+    """),
+
+    # Избранное пользователя по VK ID
+    "favorites_by_vk_id": ("bigint", """
+        SELECT p.first_name, p.last_name,
+               COALESCE(p.profile_url, ('https://vk.com/id' || p.vk_id)) AS profile_url
+        FROM users u
+        JOIN like_dislike ld ON ld.user_id = u.id
+        JOIN vk_profiles p ON p.id = ld.vk_profiles_id
+        WHERE u.vk_user_id = $1
+          AND ld.status = 'like'
+        ORDER BY ld.added_at DESC
+    """),
+}
+
+
+def prepare_statement(cur, name: str):
+    """
+    Подготавливает запрос name в сессии подключения курсора,
+    если он ещё не подготовлен.
+
+    Args:
+        cur: Курсор psycopg2 подключения BotConnection.
+        name (str): Имя запроса из STATEMENTS.
+
+    Raises:
+        KeyError: Если запроса с таким именем нет в реестре.
+    """
+    conn = cur.connection
+    if name in conn.prepared_statements:
+        return
+    param_types, sql = STATEMENTS[name]
+    cur.execute(f"PREPARE {name} ({param_types}) AS {sql}")
+    conn.prepared_statements.add(name)
+
+
+def execute_prepared(cur, name: str, params: tuple = ()):
+    """
+    Выполняет подготовленный запрос по имени, подготавливая его
+    при первом использовании на этом подключении.
+
+    Args:
+        cur: Курсор psycopg2 подключения BotConnection.
+        name (str): Имя запроса из STATEMENTS.
+        params (tuple): Значения параметров $1, $2, ... по порядку.
+
+    Raises:
+        KeyError: Если запроса с таким именем нет в реестре.
+    """
+    prepare_statement(cur, name)
+    if not params:
+        cur.execute(f"EXECUTE {name}")
+        return
+    placeholders = ", ".join(["%s"] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})", params)
@@ -2,32 +2,60 @@
 Главный модуль интеграционного VK Dating Bot.
 
 Отвечает за:
-- запуск бота и прослушивание событий через VK LongPoll;
+- запуск бота и прослушивание событий через VK LongPoll (по циклу на группу);
 - обработку сообщений пользователей;
 - показ кандидатов и управление их статусами (избранное / черный список);
 - интеграцию с базой данных (создание таблиц, добавление пользователей, получение кандидатов);
-- хранение состояния последнего показанного кандидата для каждого пользователя.
+- хранение состояния пользователей (последний показанный кандидат, регистрация)
+  в ограниченном хранилище;
+- сохранение состояния в снимок и восстановление при перезапуске;
+- вывод метрик обработки сообщений по каждой группе.
 
 Использует функции из vk_bot_modules и db_modules.
 """
 
+import os
+import signal
+import sys
+import threading
+import time
 
 from vk_bot_modules import (
-    longpoll,
+    BotGroup,
+    load_groups,
+    set_current_group,
+    current_group,
+    find_group,
     VkEventType,
     send_message,
     create_keyboard,
-    user_last_candidate  # используем глобальное состояние из модуля
+    user_states,  # используем глобальное состояние из модуля
+    REGISTRATION_TTL
 )
 from db_modules import (
     add_user_to_db,
     get_next_candidate_from_db,
     add_to_status,
     get_favorites,
-    create_tables
+    create_tables,
+    refresh_candidate_pool,
+    backfill_matches,
+    set_user_group
 )
+from db_connection import get_db_connection, ensure_pool_capacity
+from db_statements import execute_prepared
+from profiling import profile_request, install_signal_handler, dump_pending_profile
+from user_state import UserState
+from state_snapshot import save_snapshot, load_snapshot, snapshot_interval
 
-def safe_add_to_status(vk_user_id: int, candidate_profile_id: int, status: str):
+# Интервал вывода метрик групп, сек
+metrics_interval = float(os.getenv("BOT_METRICS_INTERVAL", "300"))
+
+# Известные команды бота (остальной текст в журнал профилирования не пишется)
+COMMANDS = ("привет", "начать", "start", "следующий", "в избранное",
+            "в черный список", "список избранных")
+
+def safe_add_to_status(vk_user_id: int, candidate_profile_id: int, status: str) -> dict:
     """
     Добавляет статус (like/dislike) кандидату для пользователя, безопасно преобразуя
     внутренний ID профиля в VK ID.
@@ -39,19 +67,47 @@ def safe_add_to_status(vk_user_id: int, candidate_profile_id: int, status: str):
         candidate_profile_id (int): Внутренний ID кандидата в таблице vk_profiles.
         status (str): Статус для записи, "like" или "dislike".
 
+    Returns:
+        dict: Результат add_to_status.
+
     Raises:
         ValueError: Если профиль с указанным ID не найден в БД.
     """
-    from db_connection import create_db_connection
-    with create_db_connection() as conn:
+    with get_db_connection(readonly=True, user_id=vk_user_id) as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT vk_id FROM vk_profiles WHERE id = %s", (candidate_profile_id,))
+            execute_prepared(cur, "profile_vk_id_by_id", (candidate_profile_id,))
             row = cur.fetchone()
             if not row:
                 raise ValueError(f"Профиль с id={candidate_profile_id} не найден")
             vk_candidate_id = row[0]
     # Вызываем оригинальную функцию, которая ожидает VK ID кандидата как last_id
-    add_to_status(vk_user_id, vk_candidate_id, status)
+    return add_to_status(vk_user_id, vk_candidate_id, status)
+
+def notify_matches(vk_user_id: int, matches: list[dict]):
+    """
+    Сообщает обоим пользователям о взаимной симпатии.
+
+    Пользователю, поставившему лайк, сообщение отправляется от группы
+    текущего потока, второму — от группы, в которую пишет он (VK не даёт
+    писать от имени сообщества, которому пользователь не писал).
+
+    Args:
+        vk_user_id (int): VK ID пользователя, поставившего лайк.
+        matches (list[dict]): Пользователи с новой взаимной симпатией
+            (поле "matches" результата add_to_status).
+    """
+    for match in matches:
+        other_vk_id = match["vk_user_id"]
+        other_group = find_group(match.get("group")) or current_group()
+        # Ошибка отправки одному пользователю не должна мешать уведомить
+        # другого: например, он мог запретить сообщения от сообщества
+        for recipient, partner, group in ((vk_user_id, other_vk_id, current_group()),
+                                          (other_vk_id, vk_user_id, other_group)):
+            try:
+                send_message(recipient, f"У вас взаимная симпатия! https://vk.com/id{partner}",
+                             group=group)
+            except Exception as e:
+                print(f"Не удалось уведомить {recipient} о взаимной симпатии: {e}")
 
 def handle_message(event):
     """
@@ -64,15 +120,41 @@ def handle_message(event):
     - Вывод списка избранных;
     - Сообщение о неизвестной команде.
 
+    При включенном профилировании обработка замеряется (см. модуль profiling).
+
     Args:
         event (VkEventType): Событие нового сообщения от VK LongPoll.
     """
     user_id = event.user_id
     text = event.text.strip().lower()
 
-    # Гарантируем, что пользователь в БД
+    command = text if text in COMMANDS else "unknown"
+    with profile_request(command, user_id):
+        process_message(user_id, text)
+
+def process_message(user_id: int, text: str):
+    """
+    Выполняет команду пользователя. Вызывается из handle_message.
+
+    Args:
+        user_id (int): VK ID пользователя.
+        text (str): Текст сообщения в нижнем регистре без пробелов по краям.
+    """
+    # Гарантируем, что пользователь в БД (повторно — не чаще раза в REGISTRATION_TTL).
+    # Состояние, вытесненное из памяти, загружается из БД
     try:
-        add_user_to_db(user_id)
+        state = user_states.get(user_id)
+        if (state is None or state.registered_at is None
+                or time.time() - state.registered_at > REGISTRATION_TTL):
+            user_db_id, _ = add_user_to_db(user_id)
+            state = user_states.get_or_create(user_id)
+            state.user_db_id = user_db_id
+            state.registered_at = time.time()
+        # Запоминаем группу, в которую пишет пользователь (в БД — только при смене)
+        group_name = current_group().name
+        if state.group != group_name:
+            set_user_group(user_id, group_name)
+            state.group = group_name
     except Exception as e:
         send_message(user_id, "Ошибка при регистрации. Попробуйте позже.")
         print(f"Ошибка регистрации пользователя {user_id}: {e}")
@@ -87,11 +169,12 @@ def handle_message(event):
         )
 
     elif text == "следующий":
-        last_id = user_last_candidate.get(user_id)
-        candidate = get_next_candidate_from_db(user_id, last_id)
+        candidate = get_next_candidate_from_db(user_id, state.last_candidate, state.last_score)
         if candidate:
             # candidate — это СЛОВАРЬ (согласно реальному db_modules.py)
-            user_last_candidate[user_id] = candidate["id"]  # сохраняем внутренний id
+            state.last_candidate = candidate["id"]  # сохраняем внутренний id
+            state.last_score = candidate["score"]  # и позицию в корзине
+            state.shown_candidate = candidate["id"]  # его можно оценить
             name = f"{candidate['first_name']} {candidate['last_name']}"
             link = candidate["vk_link"]
             photos = ",".join(candidate["photos"])
@@ -105,19 +188,26 @@ def handle_message(event):
             send_message(user_id, "Больше кандидатов нет.")
 
     elif text == "в избранное":
-        last_id = user_last_candidate.get(user_id)  # это внутренний id из vk_profiles.id
+        # Оценивается только кандидат, показанный в этом процессе: курсор,
+        # загруженный из БД или снимка, может указывать на другую анкету
+        last_id = state.shown_candidate  # это внутренний id из vk_profiles.id
         if last_id:
+            result = None
             try:
-                safe_add_to_status(user_id, last_id, "like")
+                result = safe_add_to_status(user_id, last_id, "like")
                 send_message(user_id, "Пользователь добавлен в избранное!")
             except Exception as e:
-                send_message(user_id, "Не удалось добавить в избранное.")
+                if result is None:
+                    send_message(user_id, "Не удалось добавить в избранное.")
                 print(f"Ошибка like: {e}")
+            # Лайк уже сохранён: о взаимной симпатии сообщаем в любом случае
+            if result is not None:
+                notify_matches(user_id, result.get("matches", []))
         else:
             send_message(user_id, "Сначала выберите кандидата.")
 
     elif text == "в черный список":
-        last_id = user_last_candidate.get(user_id)
+        last_id = state.shown_candidate
         if last_id:
             try:
                 safe_add_to_status(user_id, last_id, "dislike")
@@ -146,21 +236,138 @@ def handle_message(event):
             keyboard=create_keyboard()
         )
 
+def restore_state():
+    """
+    Восстанавливает курсоры просмотра и кэш регистрации из снимка состояния,
+    если снимок есть и не устарел.
+    """
+    cursors, registered = load_snapshot(registration_ttl=REGISTRATION_TTL)
+    for user_id in cursors.keys() | registered.keys():
+        last_candidate, last_score = cursors.get(user_id, (None, None))
+        user_db_id, registered_at = registered.get(user_id, (None, None))
+        user_states.put(user_id, UserState(last_candidate, user_db_id, registered_at,
+                                           last_score=last_score))
+    if cursors or registered:
+        print(f"Состояние восстановлено: курсоров {len(cursors)}, "
+              f"пользователей {len(registered)}")
+
+def save_state():
+    """
+    Сохраняет курсоры просмотра и кэш регистрации в снимок состояния.
+    """
+    cursors = {}
+    registered = {}
+    for user_id, state in user_states.items():
+        if state.last_candidate is not None:
+            cursors[user_id] = (state.last_candidate, state.last_score)
+        if state.user_db_id is not None and state.registered_at is not None:
+            registered[user_id] = (state.user_db_id, state.registered_at)
+    try:
+        save_snapshot(cursors, registered)
+    except OSError as e:
+        print(f"Ошибка сохранения снимка состояния: {e}")
+
+def stop_bot(signum, frame):
+    """
+    Обработчик SIGTERM: завершает цикл бота так же, как Ctrl+C,
+    чтобы состояние успело сохраниться.
+    """
+    raise SystemExit(0)
+
+def run_group(group: BotGroup):
+    """
+    Цикл обработки сообщений одной группы. Выполняется в отдельном потоке.
+
+    Ошибка обработки сообщения учитывается в метриках группы и не
+    останавливает цикл; при разрыве LongPoll цикл переподключается.
+
+    Args:
+        group (BotGroup): Группа, сообщения которой обрабатываются.
+    """
+    set_current_group(group)
+    while True:
+        try:
+            for event in group.longpoll.listen():
+                if event.type == VkEventType.MESSAGE_NEW and event.to_me:
+                    start = time.perf_counter()
+                    failed = False
+                    try:
+                        handle_message(event)
+                    except Exception as e:
+                        failed = True
+                        print(f"[{group.name}] Ошибка обработки сообщения {event.user_id}: {e}")
+                    group.metrics.record_message((time.perf_counter() - start) * 1000, failed)
+        except Exception as e:
+            print(f"[{group.name}] Ошибка LongPoll, переподключение: {e}")
+            group.reset_longpoll()
+            time.sleep(5)
+
+def report_metrics(groups: list[BotGroup]):
+    """
+    Выводит метрики обработки сообщений по каждой группе
+    и счётчики хранилища состояния пользователей.
+
+    Args:
+        groups (list[BotGroup]): Обслуживаемые группы.
+    """
+    for group in groups:
+        m = group.metrics.summary()
+        print(f"[{group.name}] сообщений: {m['messages']}, ошибок: {m['errors']}, "
+              f"отправлено: {m['sent']}, среднее: {m['avg_ms']} мс, максимум: {m['max_ms']} мс")
+    st = user_states.stats()
+    print(f"[user_states] записей: {st['size']}/{st['capacity']}, ~{st['bytes'] // 1024} КБ, "
+          f"попаданий: {st['hits']}, промахов: {st['misses']}, "
+          f"загрузок из БД: {st['reloads']}, вытеснений: {st['evictions']}")
+
 def main():
     """
     Главная функция запуска интеграционного бота.
 
     Выполняет:
-    - Создание таблиц в базе данных;
-    - Прослушивание новых сообщений через VK LongPoll;
-    - Вызов handle_message для обработки каждого сообщения.
+    - Назначение сигнала SIGUSR1 для переключения профилирования;
+    - Расчёт размера пула подключений к БД по числу групп;
+    - Создание таблиц в базе данных и пересчёт пула кандидатов;
+    - Восстановление состояния из снимка;
+    - Запуск цикла run_group для каждой группы из load_groups
+      (пул подключений к БД, бюджет VK API и кэши у групп общие);
+    - Периодическое сохранение снимка состояния и вывод метрик групп,
+      сохранение снимка при остановке.
     """
     print("Запуск интеграционного бота...")
+    install_signal_handler()  # kill -USR1 <pid> включает/выключает профилирование
+    signal.signal(signal.SIGTERM, stop_bot)
+    groups = load_groups()
+    # Сообщение занимает до двух подключений (add_to_status), пул не ждёт свободных
+    ensure_pool_capacity(2 * len(groups))
     create_tables()  # создаём таблицы при старте
-    print("Бот запущен и ожидает сообщений...")
-    for event in longpoll.listen():
-        if event.type == VkEventType.MESSAGE_NEW and event.to_me:
-            handle_message(event)
+    print(f"Пул кандидатов обновлён, строк: {refresh_candidate_pool()}")
+    restore_state()
+    for group in groups:
+        threading.Thread(target=run_group, args=(group,),
+                         name=f"group-{group.name}", daemon=True).start()
+    print(f"Бот запущен и ожидает сообщений (групп: {len(groups)})...")
+    last_snapshot = last_metrics = time.monotonic()
+    try:
+        while True:
+            time.sleep(1)
+            dump_pending_profile()
+            if time.monotonic() - last_snapshot >= snapshot_interval:
+                save_state()
+                last_snapshot = time.monotonic()
+            if time.monotonic() - last_metrics >= metrics_interval:
+                report_metrics(groups)
+                last_metrics = time.monotonic()
+    except KeyboardInterrupt:
+        print("Остановка бота...")
+    finally:
+        save_state()
+        dump_pending_profile()
+        report_metrics(groups)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--backfill-matches" in sys.argv[1:]:
+        # Разовое заполнение matches по уже существующим лайкам
+        create_tables()
+        print(f"Добавлено взаимных симпатий: {backfill_matches()}")
+    else:
+        main()
\ No newline at end of file
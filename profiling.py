@@ -0,0 +1,284 @@
+"""
+Модуль профилирования обработки сообщений VK Dating Bot.
+
+Функционал:
+- Включение и выключение профилирования во время работы бота
+  (переменная окружения PROFILING=1, сигнал SIGUSR1 или функции
+  enable_profiling / disable_profiling).
+- Профилирование handle_message через cProfile с выгрузкой результатов
+  в стандартный формат .prof (читается pstats, snakeviz, gprof2dot).
+- Журнал медленных запросов с разбивкой времени по вызовам VK API,
+  SQL-запросам и получению подключений к БД.
+
+Пока профилирование выключено, замеры не выполняются и накладных
+расходов на обработку сообщений нет.
+"""
+
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import pstats
+import re
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Настройки профилирования
+profiling_enabled = os.getenv("PROFILING", "0") == "1"
+slow_request_ms = float(os.getenv("PROFILING_SLOW_MS", "500"))
+profile_dir = os.getenv("PROFILING_DIR", "profiles")
+slow_log_path = os.getenv("PROFILING_SLOW_LOG", os.path.join(profile_dir, "slow_requests.log"))
+
+# Трассировка текущего запроса (None — запрос не профилируется)
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+# Накопленная статистика cProfile за время включенного профилирования
+_aggregate_stats = None
+_lock = threading.Lock()
+
+# Выгрузка профиля, отложенная обработчиком сигнала (см. dump_pending_profile)
+_dump_pending = False
+
+
+def enable_profiling():
+    """
+    Включает профилирование обработки сообщений.
+    """
+    global profiling_enabled
+    profiling_enabled = True
+    print("Профилирование включено")
+
+
+def disable_profiling() -> str | None:
+    """
+    Выключает профилирование и выгружает накопленную статистику cProfile.
+
+    Returns:
+        str | None: Путь к файлу .prof или None, если статистики нет.
+    """
+    global profiling_enabled
+    profiling_enabled = False
+    path = dump_profile()
+    print(f"Профилирование выключено, профиль: {path}")
+    return path
+
+
+def toggle_profiling(signum=None, frame=None):
+    """
+    Переключает профилирование. Используется как обработчик сигнала SIGUSR1.
+
+    Только меняет флаг: обработчик сигнала может прервать поток, держащий
+    _lock, поэтому выгрузка профиля при выключении откладывается до вызова
+    dump_pending_profile вне обработчика.
+    """
+    global profiling_enabled, _dump_pending
+    profiling_enabled = not profiling_enabled
+    if not profiling_enabled:
+        _dump_pending = True
+
+
+def dump_pending_profile() -> str | None:
+    """
+    Выгружает профиль, если профилирование было выключено сигналом.
+    Вызывается периодически из основного цикла бота.
+
+    Returns:
+        str | None: Путь к файлу .prof или None, если выгружать нечего.
+    """
+    global _dump_pending
+    if not _dump_pending:
+        return None
+    _dump_pending = False
+    path = dump_profile()
+    print(f"Профилирование выключено, профиль: {path}")
+    return path
+
+
+def install_signal_handler():
+    """
+    Назначает переключение профилирования на сигнал SIGUSR1
+    (`kill -USR1 <pid>`). На платформах без SIGUSR1 ничего не делает.
+    """
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, toggle_profiling)
+
+
+def dump_profile(path: str | None = None) -> str | None:
+    """
+    Выгружает накопленную статистику cProfile в файл и сбрасывает её.
+
+    Args:
+        path (str | None): Путь к файлу. По умолчанию —
+            PROFILING_DIR/handle_message_<время>.prof.
+
+    Returns:
+        str | None: Путь к файлу или None, если статистики нет.
+    """
+    global _aggregate_stats
+    with _lock:
+        stats, _aggregate_stats = _aggregate_stats, None
+    if stats is None:
+        return None
+    if path is None:
+        path = _profile_path("handle_message")
+    stats.dump_stats(path)
+    return path
+
+
+@contextmanager
+def span(kind: str, name: str):
+    """
+    Замеряет время участка кода внутри профилируемого запроса.
+
+    Если текущий запрос не профилируется, замер не выполняется.
+
+    Args:
+        kind (str): Тип участка: "vk", "sql" или "db_connect".
+        name (str): Имя метода VK API или SQL-запроса.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace["spans"].append({
+            "kind": kind,
+            "name": name,
+            "ms": round((time.perf_counter() - start) * 1000, 3)
+        })
+
+
+@contextmanager
+def profile_request(command: str, user_id: int):
+    """
+    Профилирует обработку одного сообщения, если профилирование включено.
+
+    Запросы дольше PROFILING_SLOW_MS записываются в журнал медленных
+    запросов, а их профиль cProfile сохраняется в отдельный файл .prof.
+
+    Args:
+        command (str): Команда пользователя.
+        user_id (int): VK ID пользователя.
+    """
+    if not profiling_enabled:
+        yield
+        return
+
+    trace = {"command": command, "user_id": user_id, "spans": []}
+    token = _current_trace.set(trace)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Другой профилировщик уже активен (например, в соседнем потоке)
+        profiler = None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        total_ms = (time.perf_counter() - start) * 1000
+        if profiler is not None:
+            profiler.disable()
+        _current_trace.reset(token)
+        _record_request(trace, total_ms, profiler)
+
+
+class ProfiledCursorMixin:
+    """
+    Примесь к курсору psycopg2, замеряющая время каждого execute.
+    """
+
+    def execute(self, query, vars=None):
+        with span("sql", _statement_name(query)):
+            return super().execute(query, vars)
+
+
+class ProfiledConnection(psycopg2.extensions.connection):
+    """
+    Подключение psycopg2, создающее замеряющие курсоры,
+    пока профилирование включено.
+    """
+
+    def cursor(self, name=None, cursor_factory=None, **kwargs):
+        if profiling_enabled:
+            factory = cursor_factory or self.cursor_factory or psycopg2.extensions.cursor
+            cursor_factory = _profiled_cursor_class(factory)
+        return super().cursor(name, cursor_factory=cursor_factory, **kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def _profiled_cursor_class(factory: type) -> type:
+    """
+    Создает (и кэширует) класс курсора с замером времени на основе factory.
+    """
+    return type(f"Profiled{factory.__name__}", (ProfiledCursorMixin, factory), {})
+
+
+def _statement_name(query) -> str:
+    """
+    Возвращает краткое имя SQL-запроса для журнала: первые 80 символов
+    текста запроса без лишних пробелов.
+    """
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    return re.sub(r"\s+", " ", str(query)).strip()[:80]
+
+
+def _profile_path(prefix: str) -> str:
+    """
+    Формирует путь к новому файлу .prof в каталоге PROFILING_DIR.
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    return os.path.join(profile_dir, f"{prefix}_{stamp}.prof")
+
+
+def _record_request(trace: dict, total_ms: float, profiler: cProfile.Profile | None):
+    """
+    Добавляет профиль запроса в накопленную статистику и, если запрос
+    медленный, пишет его разбивку в журнал медленных запросов.
+    """
+    global _aggregate_stats
+    if profiler is not None:
+        with _lock:
+            if _aggregate_stats is None:
+                _aggregate_stats = pstats.Stats(profiler)
+            else:
+                _aggregate_stats.add(profiler)
+
+    if total_ms < slow_request_ms:
+        return
+
+    breakdown = {}
+    for item in trace["spans"]:
+        breakdown[item["kind"]] = breakdown.get(item["kind"], 0) + item["ms"]
+    breakdown["other"] = total_ms - sum(breakdown.values())
+
+    entry = {
+        "time": datetime.now(timezone.utc).isoformat(),
+        "command": trace["command"],
+        "user_id": trace["user_id"],
+        "total_ms": round(total_ms, 3),
+        "breakdown_ms": {k: round(v, 3) for k, v in breakdown.items()},
+        "spans": trace["spans"],
+        "profile": None
+    }
+    if profiler is not None:
+        entry["profile"] = _profile_path(f"slow_{trace['user_id']}")
+        profiler.dump_stats(entry["profile"])
+
+    os.makedirs(os.path.dirname(slow_log_path) or ".", exist_ok=True)
+    with _lock, open(slow_log_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
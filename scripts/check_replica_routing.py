@@ -0,0 +1,131 @@
+"""
+Проверка маршрутизации запросов между основным сервером и репликой
+(db_connection.get_db_connection) на серверах из .env.
+
+Проверяется, что чтение пользователя:
+- без недавних записей идёт на реплику;
+- сразу после записи (mark_write) идёт на основной сервер;
+- через DB_READ_YOUR_WRITES_SEC после записи снова идёт на реплику;
+- на подключении из пула реплики, разорванном сервером (как после
+  перезапуска реплики), идёт на основной сервер, а следующее — снова
+  на реплику;
+- при недоступной реплике идёт на основной сервер.
+
+Куда ушёл запрос, определяется по pg_is_in_recovery(): на реплике он
+возвращает true. Запись выполняется во временную таблицу основного сервера.
+
+Запуск из корня проекта (нужен DB_REPLICA_DSN):
+    python scripts/check_replica_routing.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Короткое окно read-your-writes, чтобы проверка не ждала долго, и проверка
+# каждого подключения к реплике, взятого из пула
+os.environ.setdefault("DB_READ_YOUR_WRITES_SEC", "2")
+os.environ.setdefault("DB_REPLICA_CHECK_IDLE_SEC", "0")
+
+import psycopg2
+
+import db_connection
+from db_connection import get_db_connection, mark_write
+
+# Синтетический VK ID: в базе не используется
+USER_ID = -1
+
+
+def read_goes_to_replica() -> bool:
+    """
+    Выполняет чтение от имени USER_ID.
+
+    Returns:
+        bool: Чтение выполнено на реплике.
+    """
+    with get_db_connection(readonly=True, user_id=USER_ID) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_is_in_recovery()")
+            return cur.fetchone()[0]
+
+
+def write_on_primary():
+    """
+    Выполняет запись на основном сервере и отмечает её для USER_ID.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_is_in_recovery()")
+            check(not cur.fetchone()[0], "запись выполнена на основном сервере")
+            cur.execute("CREATE TEMP TABLE replica_routing_check (id INTEGER) ON COMMIT DROP")
+            cur.execute("INSERT INTO replica_routing_check VALUES (%s)", (USER_ID,))
+    mark_write(USER_ID)
+
+
+def terminate_pooled_replica_connection():
+    """
+    Завершает на реплике серверный процесс подключения, лежащего в пуле
+    реплики: подключение остаётся в пуле, но уже разорвано.
+    """
+    with get_db_connection(readonly=True, user_id=USER_ID) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_backend_pid(), pg_is_in_recovery()")
+            pid, on_replica = cur.fetchone()
+    check(on_replica, "подключение для разрыва взято из пула реплики")
+
+    admin = psycopg2.connect(db_connection.db_replica_dsn)
+    try:
+        admin.autocommit = True
+        with admin.cursor() as cur:
+            cur.execute("SELECT pg_terminate_backend(%s)", (pid,))
+    finally:
+        admin.close()
+    # Даём серверу завершить процесс
+    time.sleep(0.5)
+
+
+def check(condition: bool, message: str):
+    """
+    Печатает результат проверки и завершает скрипт при ошибке.
+    """
+    if not condition:
+        print(f"ОШИБКА: {message}")
+        sys.exit(1)
+    print(f"OK: {message}")
+
+
+def main():
+    """
+    Запускает проверки и печатает результат.
+    """
+    if not db_connection.db_replica_dsn:
+        print("Не задан DB_REPLICA_DSN")
+        sys.exit(2)
+    window = db_connection.read_your_writes_sec
+
+    check(read_goes_to_replica(), "чтение без недавних записей идёт на реплику")
+
+    write_on_primary()
+    check(not read_goes_to_replica(),
+          f"чтение сразу после записи идёт на основной сервер (окно {window} с)")
+
+    time.sleep(window + 0.5)
+    check(read_goes_to_replica(), f"чтение через {window} с после записи идёт на реплику")
+
+    terminate_pooled_replica_connection()
+    check(not read_goes_to_replica(),
+          "при разорванном подключении из пула реплики чтение идёт на основной сервер")
+    check(read_goes_to_replica(), "следующее чтение снова идёт на реплику")
+
+    # Недоступная реплика: пул к ней создаётся заново по неверному адресу
+    db_connection.db_replica_dsn = "host=127.0.0.1 port=1 connect_timeout=1"
+    replica_pool = db_connection._pools.pop("replica", None)
+    if replica_pool is not None:
+        replica_pool.closeall()
+    check(not read_goes_to_replica(), "при недоступной реплике чтение идёт на основной сервер")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Модуль снимков состояния VK Dating Bot в памяти для «тёплого» перезапуска.
+
+Сохраняет в локальный файл:
+- курсоры просмотра анкет (последний показанный кандидат пользователя
+  и его score на момент показа);
+- кэш регистрации пользователей (VK ID → users.id и время регистрации).
+
+Формат файла — компактный двоичный (little-endian):
+- заголовок: сигнатура b"VKSS", версия формата, время создания снимка,
+  количество курсоров и записей кэша регистрации;
+- массив курсоров: (vk_user_id, vk_profiles.id, score), int64, int64,
+  int32; score -1 — неизвестен;
+- массив кэша регистрации: (vk_user_id, users.id, время регистрации),
+  int64, int64, float64.
+
+Записи фиксированной длины позволяют читать файл через mmap без
+промежуточного разбора. Снимок другой версии или старше
+STATE_SNAPSHOT_MAX_AGE секунд игнорируется.
+
+Параметры загружаются из переменных окружения (.env):
+- STATE_SNAPSHOT_PATH — путь к файлу снимка;
+- STATE_SNAPSHOT_INTERVAL — интервал периодического сохранения, сек;
+- STATE_SNAPSHOT_MAX_AGE — максимальный возраст снимка при загрузке, сек.
+"""
+
+import mmap
+import os
+import struct
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+snapshot_path = os.getenv("STATE_SNAPSHOT_PATH", "bot_state.bin")
+snapshot_interval = float(os.getenv("STATE_SNAPSHOT_INTERVAL", "300"))
+snapshot_max_age = float(os.getenv("STATE_SNAPSHOT_MAX_AGE", "3600"))
+
+SNAPSHOT_MAGIC = b"VKSS"
+SNAPSHOT_VERSION = 2
+
+# Заголовок: сигнатура, версия, резерв, время создания, число курсоров, число регистраций
+_HEADER = struct.Struct("<4sHHdII")
+_CURSOR = struct.Struct("<qqi")
+# score курсора, сохранённого без score
+_NO_SCORE = -1
+_REGISTRATION = struct.Struct("<qqd")
+
+
+def save_snapshot(cursors: dict[int, tuple[int, int | None]],
+                  registered: dict[int, tuple[int, float]],
+                  path: str | None = None) -> int:
+    """
+    Сохраняет состояние бота в файл снимка.
+
+    Файл сначала пишется во временный и затем атомарно заменяет старый,
+    поэтому прерванное сохранение не портит предыдущий снимок.
+
+    Args:
+        cursors (dict[int, tuple[int, int | None]]): VK ID пользователя →
+            (внутренний ID последнего показанного кандидата, его score
+            на момент показа или None).
+        registered (dict[int, tuple[int, float]]): VK ID пользователя →
+            (users.id, время регистрации в секундах Unix).
+        path (str | None): Путь к файлу. По умолчанию STATE_SNAPSHOT_PATH.
+
+    Returns:
+        int: Размер снимка в байтах.
+    """
+    path = path or snapshot_path
+    # Копируем элементы сразу, чтобы не зависеть от изменений словарей
+    cursor_items = list(cursors.items())
+    registered_items = list(registered.items())
+
+    size = (_HEADER.size + _CURSOR.size * len(cursor_items)
+            + _REGISTRATION.size * len(registered_items))
+    buf = bytearray(size)
+    _HEADER.pack_into(buf, 0, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, time.time(),
+                      len(cursor_items), len(registered_items))
+    offset = _HEADER.size
+    for vk_user_id, (profile_id, score) in cursor_items:
+        _CURSOR.pack_into(buf, offset, vk_user_id, profile_id,
+                          _NO_SCORE if score is None else score)
+        offset += _CURSOR.size
+    for vk_user_id, (user_db_id, registered_at) in registered_items:
+        _REGISTRATION.pack_into(buf, offset, vk_user_id, user_db_id, registered_at)
+        offset += _REGISTRATION.size
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buf)
+    os.replace(tmp_path, path)
+    return size
+
+
+def load_snapshot(path: str | None = None,
+                  max_age: float | None = None,
+                  registration_ttl: float | None = None
+                  ) -> tuple[dict[int, tuple[int, int | None]], dict[int, tuple[int, float]]]:
+    """
+    Загружает состояние бота из файла снимка.
+
+    Args:
+        path (str | None): Путь к файлу. По умолчанию STATE_SNAPSHOT_PATH.
+        max_age (float | None): Максимальный возраст снимка, сек.
+            По умолчанию STATE_SNAPSHOT_MAX_AGE.
+        registration_ttl (float | None): Если задан, записи кэша регистрации
+            старше этого срока, сек, не загружаются.
+
+    Returns:
+        tuple[dict[int, tuple[int, int | None]], dict[int, tuple[int, float]]]: Курсоры и кэш
+        регистрации. Пустые словари, если снимка нет, он устарел,
+        повреждён или записан другой версией формата.
+    """
+    path = path or snapshot_path
+    max_age = snapshot_max_age if max_age is None else max_age
+
+    if not os.path.exists(path) or os.path.getsize(path) < _HEADER.size:
+        return {}, {}
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, version, _, created_at, n_cursors, n_registered = _HEADER.unpack_from(mm, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            print(f"Снимок состояния {path} пропущен: неизвестный формат")
+            return {}, {}
+        now = time.time()
+        if now - created_at > max_age:
+            print(f"Снимок состояния {path} пропущен: устарел")
+            return {}, {}
+
+        cursors_end = _HEADER.size + _CURSOR.size * n_cursors
+        registered_end = cursors_end + _REGISTRATION.size * n_registered
+        if len(mm) != registered_end:
+            print(f"Снимок состояния {path} пропущен: повреждён")
+            return {}, {}
+
+        view = memoryview(mm)
+        try:
+            cursors = {}
+            for vk_user_id, profile_id, score in _CURSOR.iter_unpack(
+                    view[_HEADER.size:cursors_end]):
+                cursors[vk_user_id] = (profile_id, None if score == _NO_SCORE else score)
+            registered = {}
+            for vk_user_id, user_db_id, registered_at in _REGISTRATION.iter_unpack(
+                    view[cursors_end:registered_end]):
+                if registration_ttl is not None and now - registered_at > registration_ttl:
+                    continue
+                registered[vk_user_id] = (user_db_id, registered_at)
+        finally:
+            view.release()
+
+    return cursors, registered
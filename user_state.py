@@ -0,0 +1,216 @@
+"""
+Модуль хранения состояния пользователей VK Dating Bot в памяти.
+
+Функционал:
+- Компактная запись состояния пользователя (UserState со __slots__):
+  последний показанный кандидат и данные регистрации.
+- Ограниченное хранилище UserStateStore: лимит числа записей и
+  приблизительного объёма памяти, вытеснение давно не использованных
+  записей (LRU) и записей, простаивающих дольше заданного времени.
+- Загрузка вытесненного состояния из базы данных при следующем обращении.
+- Счётчики размера, вытеснений и загрузок из БД.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+
+
+class UserState:
+    """
+    Состояние одного пользователя бота.
+
+    Attributes:
+        last_candidate (int | None): Курсор просмотра: внутренний ID последнего
+            показанного кандидата. После загрузки из БД или снимка — лишь
+            приблизительная позиция в корзине.
+        last_score (int | None): Score этого кандидата на момент показа
+            (позиция в корзине — пара last_score, last_candidate).
+        shown_candidate (int | None): Кандидат, показанный в этом процессе
+            и ожидающий оценки. Не загружается из БД и снимка: оценивать
+            можно только то, что пользователь видел.
+        user_db_id (int | None): Внутренний ID пользователя в таблице users.
+        registered_at (float | None): Время регистрации (обновления анкеты) в секундах Unix.
+        group (str | None): Имя группы VK, в которую пишет пользователь.
+        last_seen (float): Время последнего обращения (time.monotonic).
+    """
+    __slots__ = ("last_candidate", "last_score", "shown_candidate", "user_db_id",
+                 "registered_at", "group", "last_seen")
+
+    def __init__(self, last_candidate: int | None = None, user_db_id: int | None = None,
+                 registered_at: float | None = None, last_score: int | None = None,
+                 group: str | None = None):
+        self.last_candidate = last_candidate
+        self.last_score = last_score
+        self.shown_candidate = None
+        self.user_db_id = user_db_id
+        self.registered_at = registered_at
+        self.group = group
+        self.last_seen = time.monotonic()
+
+
+# Приблизительный объём одной записи хранилища, байт: объект UserState,
+# ключ и значения полей (int и float), плюс накладные расходы OrderedDict
+# на запись (слот хэш-таблицы и узел связного списка)
+ENTRY_BYTES = (sys.getsizeof(UserState()) + 3 * sys.getsizeof(2 ** 40)
+               + 2 * sys.getsizeof(0.0) + 104)
+
+
+class UserStateStore:
+    """
+    Ограниченное по размеру хранилище состояния пользователей.
+
+    Записи упорядочены по времени последнего обращения. При превышении
+    лимита записей или памяти вытесняются самые давние, а записи без
+    обращений дольше idle_ttl секунд вытесняются при очередном обращении
+    к хранилищу. При промахе состояние загружается функцией loader
+    (например, из базы данных).
+
+    Потокобезопасно.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, idle_ttl: float,
+                 loader: Callable[[int], UserState | None] | None = None):
+        """
+        Args:
+            max_entries (int): Максимальное число записей.
+            max_bytes (int): Максимальный приблизительный объём памяти, байт.
+            idle_ttl (float): Через сколько секунд без обращений запись вытесняется.
+            loader (Callable[[int], UserState | None] | None): Загружает состояние
+                пользователя по VK ID при промахе; None — не найдено.
+        """
+        self.capacity = max(1, min(max_entries, max_bytes // ENTRY_BYTES))
+        self.idle_ttl = idle_ttl
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int) -> UserState | None:
+        """
+        Возвращает состояние пользователя, при промахе загружая его через loader.
+
+        Args:
+            user_id (int): VK ID пользователя.
+
+        Returns:
+            UserState | None: Состояние или None, если его нет ни в памяти,
+            ни в источнике loader.
+        """
+        with self._lock:
+            state = self._touch(user_id)
+            if state is not None:
+                self.hits += 1
+                return state
+            self.misses += 1
+
+        if self.loader is None:
+            return None
+        state = self.loader(user_id)
+        if state is None:
+            return None
+        with self._lock:
+            self.reloads += 1
+            # Пока шла загрузка, состояние могло появиться в другом потоке
+            current = self._touch(user_id)
+            if current is not None:
+                return current
+            self._insert(user_id, state)
+        return state
+
+    def get_or_create(self, user_id: int) -> UserState:
+        """
+        Возвращает состояние пользователя из памяти или создает пустое
+        (без обращения к loader).
+
+        Args:
+            user_id (int): VK ID пользователя.
+
+        Returns:
+            UserState: Состояние пользователя.
+        """
+        with self._lock:
+            state = self._touch(user_id)
+            if state is None:
+                state = UserState()
+                self._insert(user_id, state)
+            return state
+
+    def put(self, user_id: int, state: UserState):
+        """
+        Сохраняет состояние пользователя, заменяя имеющееся.
+
+        Args:
+            user_id (int): VK ID пользователя.
+            state (UserState): Состояние.
+        """
+        with self._lock:
+            self._entries.pop(user_id, None)
+            state.last_seen = time.monotonic()
+            self._insert(user_id, state)
+
+    def items(self) -> list[tuple[int, UserState]]:
+        """
+        Returns:
+            list[tuple[int, UserState]]: Копия списка записей (VK ID, состояние)
+            от давних к недавним.
+        """
+        with self._lock:
+            return list(self._entries.items())
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Размер хранилища (записей и приблизительно байт), лимит записей,
+            попадания, промахи, загрузки через loader и вытеснения.
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "bytes": len(self._entries) * ENTRY_BYTES,
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions
+            }
+
+    def _touch(self, user_id: int) -> UserState | None:
+        """
+        Находит запись и отмечает обращение к ней. Вызывается под блокировкой.
+        """
+        self._evict_idle()
+        state = self._entries.get(user_id)
+        if state is not None:
+            state.last_seen = time.monotonic()
+            self._entries.move_to_end(user_id)
+        return state
+
+    def _insert(self, user_id: int, state: UserState):
+        """
+        Добавляет запись и вытесняет лишние. Вызывается под блокировкой.
+        """
+        self._entries[user_id] = state
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _evict_idle(self):
+        """
+        Вытесняет записи без обращений дольше idle_ttl. Вызывается под блокировкой.
+        """
+        deadline = time.monotonic() - self.idle_ttl
+        while self._entries:
+            user_id, state = next(iter(self._entries.items()))
+            if state.last_seen > deadline:
+                break
+            del self._entries[user_id]
+            self.evictions += 1
@@ -4,15 +4,21 @@
 Функционал:
 - Получение информации о пользователе (имя, дата рождения, пол, город).
 - Получение 3 самых популярных фотографий пользователя по количеству лайков.
+- Ограничение частоты запросов к VK API (RateBudget), общее для всех
+  групп, обслуживаемых процессом.
 
 Использует токены для авторизации и получения данных о пользователях VK.
 """
 
 import os
+import threading
+import time
 import vk_api
 
 from dotenv import load_dotenv
 
+from profiling import span
+
 load_dotenv()
 
 access_token_bot = os.getenv('TOKEN_BOT')
@@ -22,6 +28,48 @@ user_id = os.getenv('VK_ID')
 vk_user_session = vk_api.VkApi(token=access_token_user)
 vk_user = vk_user_session.get_api()
 
+
+class RateBudget:
+    """
+    Ограничитель частоты запросов к VK API («ведро токенов»).
+
+    Потокобезопасен: один объект может использоваться циклами
+    нескольких групп одновременно.
+    """
+
+    def __init__(self, rate: float, burst: int | None = None):
+        """
+        Args:
+            rate (float): Допустимое число запросов в секунду.
+            burst (int | None): Сколько запросов можно сделать подряд без ожидания.
+                По умолчанию — rate, но не меньше 1.
+        """
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Ждёт, пока бюджет позволит сделать ещё один запрос, и расходует его.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Общий бюджет запросов с пользовательским токеном (VK: не более 3 в секунду)
+user_token_budget = RateBudget(float(os.getenv("VK_USER_RPS", "3")))
+
 def get_user_info(user_id: int) -> dict:
     """
     Получает информацию о пользователе VK.
@@ -32,7 +80,9 @@ def get_user_info(user_id: int) -> dict:
     Returns:
         dict: Словарь с данными пользователя (id, first_name, last_name, sex, city, bdate и др.).
     """
-    user_info = vk_user.users.get(user_ids=user_id, fields="bdate,sex,city")[0]
+    with span("vk", "users.get"):
+        user_token_budget.acquire()
+        user_info = vk_user.users.get(user_ids=user_id, fields="bdate,sex,city")[0]
     return user_info
 
 def get_top3_photos_by_likes(user_id: int) -> list[str]:
@@ -45,12 +95,14 @@ def get_top3_photos_by_likes(user_id: int) -> list[str]:
     Returns:
         list[str]: Список attachment-строк для VK API вида 'photo<owner_id>_<id>'.
     """
-    photos = vk_user.photos.get(
-        owner_id=user_id,
-        album_id='profile',  # Альбом профиля
-        extended=1,          # Включает лайки
-        count=100            # Получаем 100 фото для выбора
-    )
+    with span("vk", "photos.get"):
+        user_token_budget.acquire()
+        photos = vk_user.photos.get(
+            owner_id=user_id,
+            album_id='profile',  # Альбом профиля
+            extended=1,          # Включает лайки
+            count=100            # Получаем 100 фото для выбора
+        )
 
     # Сортируем по лайкам
     sorted_photos = sorted(
@@ -3,17 +3,24 @@
 
 Функционал:
 - Авторизация через токен группы (бот) и пользовательский токен VK.
+- Обслуживание нескольких групп (сообществ) в одном процессе: у каждой
+  группы свой LongPoll, бюджет запросов и метрики, а пул подключений к БД,
+  бюджет пользовательского токена и кэши общие.
 - Получение информации о пользователях и их фотографий.
 - Формирование и отправка сообщений пользователю.
 - Создание клавиатуры VK.
-- Хранение состояния последнего показанного кандидата.
+- Хранение состояния пользователей (последний показанный кандидат,
+  регистрация) в ограниченном хранилище user_states.
 - Основные функции запуска бота и обработки сообщений.
 
 Модуль инкапсулирует всю логику взаимодействия с VK API и
 используется вместе с модулем работы с базой данных.
 """
 
+import json
 import os
+import threading
+import time
 import vk_api
 
 from vk_api.longpoll import VkLongPoll, VkEventType
@@ -21,8 +28,11 @@ from vk_api.utils import get_random_id
 from vk_api.keyboard import VkKeyboard, VkKeyboardColor
 from dotenv import load_dotenv
 
+from profiling import span
+from vk_api_func import RateBudget
+from user_state import UserStateStore
 from db_modules import (get_next_candidate_from_db, add_to_status,
-                        get_favorites, add_user_to_db)
+                        get_favorites, add_user_to_db, load_user_state)
 
 load_dotenv()
 
@@ -34,13 +44,183 @@ user_id = os.getenv('VK_ID')
 vk_user_session = vk_api.VkApi(token=access_token_user)
 vk_user = vk_user_session.get_api()
 
-# Авторизация через токен группы (для бота)
-vk_bot_session = vk_api.VkApi(token=access_token_bot)
-vk_bot = vk_bot_session.get_api()
-longpoll = VkLongPoll(vk_bot_session)
+# Файл со списком групп (JSON) и лимит запросов с токеном группы
+groups_file = os.getenv('BOT_GROUPS_FILE')
+group_rps = float(os.getenv('VK_GROUP_RPS', '20'))
 
-# Словарь для хранения последнего показанного кандидата для каждого пользователя
-user_last_candidate = {}
+
+class GroupMetrics:
+    """
+    Счётчики обработки сообщений одной группы.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.errors = 0
+        self.sent = 0
+        self.busy_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record_message(self, elapsed_ms: float, failed: bool = False):
+        """
+        Учитывает обработанное сообщение.
+
+        Args:
+            elapsed_ms (float): Время обработки, мс.
+            failed (bool): Обработка завершилась исключением.
+        """
+        with self._lock:
+            self.messages += 1
+            self.errors += int(failed)
+            self.busy_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def record_sent(self):
+        """
+        Учитывает отправленное сообщение.
+        """
+        with self._lock:
+            self.sent += 1
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: Текущие значения счётчиков и среднее время обработки, мс.
+        """
+        with self._lock:
+            avg_ms = self.busy_ms / self.messages if self.messages else 0.0
+            return {
+                "messages": self.messages,
+                "errors": self.errors,
+                "sent": self.sent,
+                "avg_ms": round(avg_ms, 3),
+                "max_ms": round(self.max_ms, 3)
+            }
+
+
+class BotGroup:
+    """
+    Группа (сообщество) VK, которую обслуживает бот.
+
+    Хранит сессию с токеном группы, LongPoll (создаётся при первом обращении),
+    бюджет запросов к VK API с токеном группы и метрики.
+    """
+
+    def __init__(self, name: str, token: str, rps: float | None = None):
+        """
+        Args:
+            name (str): Имя группы для журналов и метрик.
+            token (str): Токен группы.
+            rps (float | None): Лимит запросов в секунду. По умолчанию VK_GROUP_RPS.
+        """
+        self.name = name
+        self.session = vk_api.VkApi(token=token)
+        self.api = self.session.get_api()
+        self.budget = RateBudget(rps or group_rps)
+        self.metrics = GroupMetrics()
+        self._longpoll = None
+
+    @property
+    def longpoll(self) -> VkLongPoll:
+        """
+        VkLongPoll группы. Создаётся при первом обращении.
+        """
+        if self._longpoll is None:
+            self._longpoll = VkLongPoll(self.session)
+        return self._longpoll
+
+    def reset_longpoll(self):
+        """
+        Сбрасывает LongPoll, чтобы при следующем обращении получить новый сервер.
+        """
+        self._longpoll = None
+
+
+def load_groups() -> list[BotGroup]:
+    """
+    Загружает список групп из файла BOT_GROUPS_FILE.
+
+    Файл — JSON-массив объектов {"name": ..., "token": ..., "rps": ...}
+    (rps необязателен). Если BOT_GROUPS_FILE не задан, возвращается
+    одна группа с токеном TOKEN_BOT.
+
+    Returns:
+        list[BotGroup]: Группы для обслуживания.
+
+    Raises:
+        ValueError: Если в файле нет ни одной группы или у группы нет токена.
+    """
+    if not groups_file:
+        return [default_group]
+
+    with open(groups_file, encoding="utf-8") as f:
+        configs = json.load(f)
+    if not configs:
+        raise ValueError(f"В {groups_file} нет ни одной группы")
+
+    groups = []
+    for idx, config in enumerate(configs):
+        if not config.get("token"):
+            raise ValueError(f"У группы №{idx + 1} в {groups_file} не указан token")
+        groups.append(BotGroup(config.get("name") or f"group{idx + 1}",
+                               config["token"], config.get("rps")))
+    for group in groups:
+        _groups_by_name[group.name] = group
+    return groups
+
+
+# Авторизация через токен группы (для бота), группа по умолчанию из .env
+default_group = BotGroup("default", access_token_bot)
+
+# Имя группы -> BotGroup (группы из load_groups и группа по умолчанию)
+_groups_by_name = {default_group.name: default_group}
+
+# Группа, сообщение которой обрабатывает текущий поток
+_local = threading.local()
+
+
+def set_current_group(group: BotGroup):
+    """
+    Назначает группу, от имени которой текущий поток отправляет сообщения.
+
+    Args:
+        group (BotGroup): Группа цикла обработки сообщений.
+    """
+    _local.group = group
+
+
+def current_group() -> BotGroup:
+    """
+    Returns:
+        BotGroup: Группа текущего потока (по умолчанию — default_group).
+    """
+    return getattr(_local, "group", default_group)
+
+
+def find_group(name: str | None) -> BotGroup | None:
+    """
+    Args:
+        name (str | None): Имя группы (BotGroup.name).
+
+    Returns:
+        BotGroup | None: Группа с этим именем или None, если бот её не обслуживает.
+    """
+    return _groups_by_name.get(name)
+
+# Состояние пользователей: последний показанный кандидат и регистрация
+# (общее для всех групп процесса). Размер ограничен USER_STATE_MAX_ENTRIES
+# записями и USER_STATE_MAX_MB мегабайтами, записи без обращений дольше
+# USER_STATE_IDLE_SEC вытесняются; вытесненное состояние загружается из БД
+user_states = UserStateStore(
+    max_entries=int(os.getenv("USER_STATE_MAX_ENTRIES", "100000")),
+    max_bytes=int(float(os.getenv("USER_STATE_MAX_MB", "64")) * 1024 * 1024),
+    idle_ttl=float(os.getenv("USER_STATE_IDLE_SEC", "86400")),
+    loader=load_user_state
+)
+
+# Как долго (сек) не повторять регистрацию пользователя при каждом сообщении
+REGISTRATION_TTL = float(os.getenv("REGISTRATION_TTL", "3600"))
 
 def create_keyboard():
     """
@@ -57,23 +237,31 @@ def create_keyboard():
     keyboard.add_button("Список избранных", VkKeyboardColor.SECONDARY)
     return keyboard.get_keyboard()
 
-def send_message(user_id: int, message: str, attachment: str = None, keyboard: str = None):
+def send_message(user_id: int, message: str, attachment: str = None, keyboard: str = None,
+                 group: BotGroup = None):
     """
-    Отправляет сообщение пользователю VK с опциональной клавиатурой и вложениями.
+    Отправляет сообщение пользователю VK с опциональной клавиатурой и вложениями
+    от имени группы текущего потока.
 
     Args:
         user_id (int): VK ID пользователя.
         message (str): Текст сообщения.
         attachment (str, optional): Строка с фотографиями или медиа.
         keyboard (str, optional): JSON-код клавиатуры VK.
+        group (BotGroup, optional): Группа-отправитель вместо группы текущего
+            потока (пользователь может писать боту в другую группу).
     """
-    vk_bot.messages.send(
-        user_id=user_id,
-        message=message,
-        random_id=get_random_id(),
-        attachment=attachment,
-        keyboard=keyboard
-    )
+    group = group or current_group()
+    with span("vk", "messages.send"):
+        group.budget.acquire()
+        group.api.messages.send(
+            user_id=user_id,
+            message=message,
+            random_id=get_random_id(),
+            attachment=attachment,
+            keyboard=keyboard
+        )
+    group.metrics.record_sent()
 
 def send_user_info(user_id: int, first_name: str, last_name: str, vk_link: str, photos: list[str]):
     """
@@ -100,7 +288,7 @@ def start_bot():
     отвечает на команды пользователя и отправляет кандидатов с фото.
     """
     print("Бот запущен...")
-    for event in longpoll.listen():
+    for event in default_group.longpoll.listen():
         if event.type == VkEventType.MESSAGE_NEW and event.to_me:
             user_id = event.user_id
             text = event.text.lower()
@@ -115,17 +303,17 @@ def start_bot():
                              keyboard=create_keyboard())
 
             elif text == "следующий":
-                last_id = user_last_candidate.get(user_id)
-                candidate = get_next_candidate_from_db(user_id, last_id)
+                state = user_states.get_or_create(user_id)
+                candidate = get_next_candidate_from_db(user_id, state.last_candidate)
                 if candidate:
-                    user_last_candidate[user_id] = candidate[0]  # id кандидата
+                    state.last_candidate = candidate[0]  # id кандидата
                     send_user_info(user_id, candidate[1], candidate[2],
                                    candidate[3], candidate[4])
                 else:
                     send_message(user_id, "Больше кандидатов нет.")
 
             elif text == "в избранное":
-                last_id = user_last_candidate.get(user_id)
+                last_id = user_states.get_or_create(user_id).last_candidate
                 if last_id:
                     add_to_status(user_id, last_id, "") # Нужно добавить статус
                     send_message(user_id, "Пользователь добавлен в избранное!")
@@ -133,7 +321,7 @@ def start_bot():
                     send_message(user_id, "Сначала выберите кандидата.")
 
             elif text == "в черный список":
-                last_id = user_last_candidate.get(user_id)
+                last_id = user_states.get_or_create(user_id).last_candidate
                 if last_id:
                     add_to_status(user_id, last_id, "") # Нужно добавить статус
                     send_message(user_id, "Пользователь добавлен в черный список!")